@@ -0,0 +1,5 @@
+import os, sys
+
+# The app imports its modules flat from src/ and config from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
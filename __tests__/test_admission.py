@@ -0,0 +1,165 @@
+from admission import AdmissionLimiter, Overloaded, ThreadTurnQueue, MERGED
+
+import asyncio, pytest
+
+async def started(*coros):
+    """Schedule the coroutines in order, letting each one reach its first wait before the next starts."""
+    tasks = []
+    for coro in coros:
+        tasks.append(asyncio.ensure_future(coro))
+        await asyncio.sleep(0.01)
+    return tasks
+
+def outcome(result):
+    return result.status_code if isinstance(result, Overloaded) else result
+
+#? Per thread ordering and merging
+@pytest.mark.asyncio
+async def test_three_messages_run_in_arrival_order():
+    queue = ThreadTurnQueue()
+    seen = []
+
+    async def run(message):
+        seen.append(message)
+        await asyncio.sleep(0.05)
+        return f"reply:{message}"
+
+    tasks = await started(*(queue.submit("u1", m, run) for m in ("a", "b", "c")))
+    assert await asyncio.gather(*tasks) == ["reply:a", "reply:b", "reply:c"]
+    assert seen == ["a", "b", "c"]
+    assert queue.stats()["threads"] == 0
+
+@pytest.mark.asyncio
+async def test_three_messages_merge_behind_running_turn():
+    queue = ThreadTurnQueue(merge_window=0.005)
+    seen = []
+
+    async def run(message):
+        seen.append(message)
+        await asyncio.sleep(0.05)
+        return f"reply:{message}"
+
+    tasks = await started(*(queue.submit("u1", m, run) for m in ("a", "b", "c")))
+    results = await asyncio.gather(*tasks)
+    # "a" starts alone; "b" and "c" queue behind it and are answered together
+    assert seen == ["a", "b\nc"]
+    assert results == ["reply:a", "reply:b\nc", MERGED]
+    assert queue.stats()["merged"] == 1
+
+@pytest.mark.asyncio
+async def test_other_threads_are_not_serialized():
+    queue = ThreadTurnQueue()
+    running = []
+
+    async def run(message):
+        running.append(message)
+        await asyncio.sleep(0.05)
+        return len(running)
+
+    results = await asyncio.gather(*(queue.submit(f"u{i}", "hi", run) for i in range(3)))
+    assert max(results) == 3  # all three were in flight together
+
+#? Per thread shedding
+@pytest.mark.asyncio
+async def test_per_thread_waiters_are_capped():
+    queue = ThreadTurnQueue(max_waiting=2)
+    release = asyncio.Event()
+
+    async def run(message):
+        await release.wait()
+        return message
+
+    tasks = await started(*(queue.submit("u1", str(i), run) for i in range(5)))
+    release.set()
+    results = [outcome(r) for r in await asyncio.gather(*tasks, return_exceptions=True)]
+    assert results == ["0", "1", "2", 429, 429]
+    assert queue.stats()["thread_rejected"] == 2
+
+@pytest.mark.asyncio
+async def test_per_thread_wait_times_out():
+    queue = ThreadTurnQueue(timeout=0.05)
+    release = asyncio.Event()
+
+    async def run(message):
+        await release.wait()
+        return message
+
+    first, second = await started(queue.submit("u1", "a", run), queue.submit("u1", "b", run))
+    with pytest.raises(Overloaded) as error:
+        await second
+    assert error.value.status_code == 503
+    release.set()
+    assert await first == "a"
+
+    # The timed out request left nothing behind: the thread's next turn runs normally
+    assert await queue.submit("u1", "c", run) == "c"
+    assert queue.stats() == {"threads": 0, "merged": 0, "thread_rejected": 0, "thread_timed_out": 1}
+
+@pytest.mark.asyncio
+async def test_timed_out_message_is_not_merged_later():
+    queue = ThreadTurnQueue(merge_window=0.01, timeout=0.05)
+    release = asyncio.Event()
+    seen = []
+
+    async def run(message):
+        seen.append(message)
+        await release.wait()
+        return message
+
+    first, second = await started(queue.submit("u1", "a", run), queue.submit("u1", "b", run))
+    with pytest.raises(Overloaded):
+        await second
+    release.set()
+    await first
+    assert await queue.submit("u1", "c", run) == "c"
+    assert seen == ["a", "c"]
+
+@pytest.mark.asyncio
+async def test_serialize_sheds_like_submit():
+    queue = ThreadTurnQueue(max_waiting=1, timeout=0.05)
+    release = asyncio.Event()
+
+    async def hold():
+        async with queue.serialize("u1"):
+            await release.wait()
+
+    async def wait_turn():
+        async with queue.serialize("u1"):
+            return "ran"
+
+    holder, waiter, extra = await started(hold(), wait_turn(), wait_turn())
+    results = [outcome(r) for r in await asyncio.gather(waiter, extra, return_exceptions=True)]
+    assert results == [503, 429]
+    release.set()
+    await holder
+    assert await wait_turn() == "ran"
+
+#? Global admission
+@pytest.mark.asyncio
+async def test_eight_users_are_shed_with_429_and_503():
+    limiter = AdmissionLimiter(max_active=2, max_queued=2, queue_timeout=0.15)
+
+    async def turn(user):
+        limiter.check()  # /chat/stream refuses up front, /chat through admit()
+        async with limiter.admit():
+            await asyncio.sleep(0.3)
+            return "ok"
+
+    tasks = await started(*(turn(f"x{i}") for i in range(8)))
+    results = [outcome(r) for r in await asyncio.gather(*tasks, return_exceptions=True)]
+    # Two run, two wait and time out in the queue, the rest are refused straight away
+    assert results == ["ok", "ok", 503, 503, 429, 429, 429, 429]
+    assert limiter.stats() == {
+        "active": 0, "waiting": 0, "max_active": 2, "max_queued": 2, "rejected": 4, "timed_out": 2,
+    }
+
+@pytest.mark.asyncio
+async def test_disabled_limiter_admits_everything():
+    limiter = AdmissionLimiter(max_active=0, max_queued=0, queue_timeout=0.01)
+
+    async def turn():
+        async with limiter.admit():
+            await asyncio.sleep(0.02)
+            return "ok"
+
+    assert await asyncio.gather(*(turn() for _ in range(8))) == ["ok"] * 8
@@ -0,0 +1,130 @@
+from typing import Annotated, TypedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Command, interrupt
+
+from checkpoint import BufferedCheckpointSaver
+
+import operator, pytest
+
+# The same scenario runs against a plain MemorySaver and a BufferedCheckpointSaver wrapping one, inside turn();
+# everything the graph and a reader can observe must match
+
+class State(TypedDict):
+    log: Annotated[list, operator.add]
+
+def build(checkpointer, fail: dict):
+    def first(state: State):
+        return {"log": ["first"]}
+
+    def ask(state: State):
+        answer = interrupt("name?")
+        return {"log": [f"answer:{answer}"]}
+
+    def last(state: State):
+        if fail.get("last"):
+            raise RuntimeError("boom")
+        return {"log": ["last"]}
+
+    builder = StateGraph(State)
+    builder.add_node("first", first)
+    builder.add_node("ask", ask)
+    builder.add_node("last", last)
+    builder.add_edge(START, "first")
+    builder.add_edge("first", "ask")
+    builder.add_edge("ask", "last")
+    builder.add_edge("last", END)
+    return builder.compile(checkpointer=checkpointer)
+
+def config(thread_id: str):
+    return {"configurable": {"thread_id": thread_id}}
+
+async def snapshot(graph, thread_id: str):
+    state = await graph.aget_state(config(thread_id))
+    interrupts = [i.value for task in state.tasks for i in task.interrupts]
+    errors = [task.error is not None for task in state.tasks]
+    return state.values, state.next, interrupts, errors
+
+async def run(graph, saver, thread_id: str, input):
+    if isinstance(saver, BufferedCheckpointSaver):
+        async with saver.turn(thread_id):
+            return await graph.ainvoke(input, config(thread_id))
+    return await graph.ainvoke(input, config(thread_id))
+
+def savers():
+    plain = MemorySaver()
+    buffered = BufferedCheckpointSaver(MemorySaver())
+    return plain, buffered
+
+@pytest.mark.asyncio
+async def test_interrupt_and_resume_match_plain_saver():
+    results = []
+    for saver in savers():
+        graph = build(saver, {})
+        paused = await run(graph, saver, "t", {"log": []})
+        at_interrupt = await snapshot(graph, "t")
+        resumed = await run(graph, saver, "t", Command(resume="Orion"))
+        results.append((paused, at_interrupt, resumed, await snapshot(graph, "t")))
+
+    plain, buffered = results
+    assert buffered == plain
+    paused, at_interrupt, resumed, final = buffered
+    assert at_interrupt[1] == ("ask",) and at_interrupt[2] == ["name?"]
+    assert resumed["log"] == ["first", "answer:Orion", "last"]
+    assert final[1] == ()
+
+@pytest.mark.asyncio
+async def test_one_checkpoint_persisted_per_turn():
+    buffered = BufferedCheckpointSaver(MemorySaver())
+    graph = build(buffered, {})
+    await run(graph, buffered, "t", {"log": []})
+    assert len([c async for c in buffered.saver.alist(config("t"))]) == 1
+    await run(graph, buffered, "t", Command(resume="Orion"))
+    assert len([c async for c in buffered.saver.alist(config("t"))]) == 2
+
+@pytest.mark.asyncio
+async def test_node_error_mid_turn_matches_plain_saver():
+    results = []
+    for saver in savers():
+        fail = {"last": True}
+        graph = build(saver, fail)
+        await run(graph, saver, "t", {"log": []})
+        with pytest.raises(RuntimeError):
+            await run(graph, saver, "t", Command(resume="Orion"))
+        after_error = await snapshot(graph, "t")
+        # Retrying picks up at the failed node without re-running the ones that succeeded
+        fail["last"] = False
+        retried = await run(graph, saver, "t", None)
+        results.append((after_error, retried))
+
+    plain, buffered = results
+    assert buffered == plain
+    after_error, retried = buffered
+    assert after_error[0]["log"] == ["first", "answer:Orion"] and after_error[1] == ("last",)
+    assert retried["log"] == ["first", "answer:Orion", "last"]
+
+@pytest.mark.asyncio
+async def test_state_reads_inside_turn_and_after_flush():
+    buffered = BufferedCheckpointSaver(MemorySaver())
+    graph = build(buffered, {})
+    async with buffered.turn("t"):
+        await graph.ainvoke({"log": []}, config("t"))
+        inside = await snapshot(graph, "t")
+        # Nothing reaches the wrapped saver until the turn ends
+        assert await buffered.saver.aget_tuple(config("t")) is None
+    after = await snapshot(graph, "t")
+    assert inside == after
+
+    # Reads go to the wrapped saver once the buffer is flushed
+    persisted = await buffered.saver.aget_tuple(config("t"))
+    assert persisted.checkpoint["id"] == (await buffered.aget_tuple(config("t"))).checkpoint["id"]
+    assert [w[1] for w in persisted.pending_writes] == ["__interrupt__"]
+
+@pytest.mark.asyncio
+async def test_update_state_outside_turn_goes_straight_through():
+    buffered = BufferedCheckpointSaver(MemorySaver())
+    graph = build(buffered, {})
+    await run(graph, buffered, "t", {"log": []})
+    await graph.aupdate_state(config("t"), {"log": ["manual"]})
+    assert (await buffered.saver.aget_tuple(config("t"))).checkpoint["channel_values"]["log"][-1] == "manual"
@@ -0,0 +1,144 @@
+from typing import Annotated, TypedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.constants import ERROR, INTERRUPT
+from langgraph.graph import StateGraph, START, END
+from langgraph.types import Command, interrupt
+
+from checkpoint import CachedCheckpointSaver, DelegatingCheckpointSaver
+
+import operator, pytest
+
+class CountingSaver(DelegatingCheckpointSaver):
+    """Counts the loads that reach the database stand-in."""
+    def __init__(self, saver):
+        super().__init__(saver)
+        self.loads = 0
+
+    async def aget_tuple(self, config):
+        self.loads += 1
+        return await self.saver.aget_tuple(config)
+
+class State(TypedDict):
+    log: Annotated[list, operator.add]
+
+def build(checkpointer):
+    def ask(state: State):
+        return {"log": [f"answer:{interrupt('name?')}"]}
+
+    builder = StateGraph(State)
+    builder.add_node("ask", ask)
+    builder.add_edge(START, "ask")
+    builder.add_edge("ask", END)
+    return builder.compile(checkpointer=checkpointer)
+
+def config(thread_id: str, checkpoint_id: str = None):
+    configurable = {"thread_id": thread_id, "checkpoint_ns": ""}
+    if checkpoint_id is not None:
+        configurable["checkpoint_id"] = checkpoint_id
+    return {"configurable": configurable}
+
+def saver():
+    return CachedCheckpointSaver(CountingSaver(MemorySaver()), max_size=10, ttl=60)
+
+async def prime(cached: CachedCheckpointSaver, thread_id: str = "t"):
+    graph = build(cached)
+    await graph.ainvoke({"log": ["hi"]}, {"configurable": {"thread_id": thread_id}})
+    return graph
+
+@pytest.mark.asyncio
+async def test_miss_then_hit():
+    cached = saver()
+    graph = build(cached.saver.saver)  # write through the inner saver only, so the cache starts cold
+    await graph.ainvoke({"log": ["hi"]}, {"configurable": {"thread_id": "t"}})
+
+    first = await cached.aget_tuple(config("t"))
+    second = await cached.aget_tuple(config("t"))
+    assert cached.saver.loads == 1
+    assert cached.stats()["misses"] == 1 and cached.stats()["hits"] == 1
+    assert first.checkpoint == second.checkpoint
+
+@pytest.mark.asyncio
+async def test_writes_keep_cache_warm_and_match_saver():
+    cached = saver()
+    graph = await prime(cached)
+    loads = cached.saver.loads
+
+    hit = await cached.aget_tuple(config("t"))
+    stored = await cached.saver.saver.aget_tuple(config("t"))
+    assert cached.saver.loads == loads
+    assert hit.checkpoint["id"] == stored.checkpoint["id"]
+    assert sorted(hit.pending_writes) == sorted(stored.pending_writes)
+    assert (await graph.aget_state({"configurable": {"thread_id": "t"}})).next == ("ask",)
+
+    await graph.ainvoke(Command(resume="Orion"), {"configurable": {"thread_id": "t"}})
+    assert (await cached.aget_tuple(config("t"))).checkpoint["channel_values"]["log"] == ["hi", "answer:Orion"]
+
+@pytest.mark.asyncio
+async def test_pending_writes_mirror_overwrite_and_append():
+    cached = saver()
+    await prime(cached)
+    current = await cached.aget_tuple(config("t"))
+    target = config("t", current.checkpoint["id"])
+
+    await cached.aput_writes(target, [("log", "a")], "task-1")
+    await cached.aput_writes(target, [("log", "b")], "task-2")
+    await cached.aput_writes(target, [(ERROR, "first")], "task-3")
+    await cached.aput_writes(target, [(ERROR, "second")], "task-3")  # special channels overwrite per task
+
+    mirrored = (await cached.aget_tuple(config("t"))).pending_writes
+    stored = (await cached.saver.saver.aget_tuple(config("t"))).pending_writes
+    assert sorted(mirrored) == sorted(stored)
+    assert ("task-3", ERROR, "second") in mirrored and ("task-3", ERROR, "first") not in mirrored
+    assert [w for w in mirrored if w[1] == "log"] == [("task-1", "log", "a"), ("task-2", "log", "b")]
+    assert any(w[1] == INTERRUPT for w in mirrored)
+
+@pytest.mark.asyncio
+async def test_writes_against_an_older_checkpoint_are_not_mirrored():
+    cached = saver()
+    await prime(cached)
+    await cached.aput_writes(config("t", "not-the-latest"), [("log", "x")], "task-1")
+    assert all(w[2] != "x" for w in (await cached.aget_tuple(config("t"))).pending_writes)
+
+@pytest.mark.asyncio
+async def test_explicit_checkpoint_id():
+    cached = saver()
+    await prime(cached)
+    history = [c async for c in cached.alist(config("t"))]
+    latest, older = history[0], history[-1]
+    loads = cached.saver.loads
+
+    # The cached id is served from memory
+    assert (await cached.aget_tuple(config("t", latest.checkpoint["id"]))).checkpoint["id"] == latest.checkpoint["id"]
+    assert cached.saver.loads == loads
+    # Anything else goes to the saver and leaves the cached latest alone
+    assert (await cached.aget_tuple(config("t", older.checkpoint["id"]))).checkpoint["id"] == older.checkpoint["id"]
+    assert cached.saver.loads == loads + 1
+    assert (await cached.aget_tuple(config("t"))).checkpoint["id"] == latest.checkpoint["id"]
+
+@pytest.mark.asyncio
+async def test_callers_cannot_mutate_the_cache():
+    cached = saver()
+    await prime(cached)
+    loaded = await cached.aget_tuple(config("t"))
+    loaded.checkpoint["channel_values"]["log"].append("mutated")
+    loaded.checkpoint["channel_versions"]["log"] = "bogus"
+    loaded.pending_writes.clear()
+
+    again = await cached.aget_tuple(config("t"))
+    assert again.checkpoint["channel_values"]["log"] == ["hi"]
+    assert again.checkpoint["channel_versions"]["log"] != "bogus"
+    assert again.pending_writes
+
+@pytest.mark.asyncio
+async def test_invalidate():
+    cached = saver()
+    await prime(cached, "a")
+    await prime(cached, "b")
+    cached.invalidate(["a"])
+    loads = cached.saver.loads
+
+    await cached.aget_tuple(config("a"))
+    assert cached.saver.loads == loads + 1
+    await cached.aget_tuple(config("b"))
+    assert cached.saver.loads == loads + 1
@@ -0,0 +1,41 @@
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from helper import build_chat_messages, trim_history, PERSONA_ID
+
+def persona():
+    return SystemMessage(content="You are Orion.", id=PERSONA_ID)
+
+def turns(count: int, words: int = 50):
+    messages = []
+    for i in range(count):
+        messages.append(HumanMessage(content=f"question {i} " + "word " * words, id=f"h{i}"))
+        messages.append(AIMessage(content=f"answer {i} " + "word " * words, id=f"a{i}"))
+    return messages
+
+def test_opener_before_first_user_message_is_kept():
+    opener = AIMessage(content="*glances up* Name's Orion. You new?")
+    user = HumanMessage(content="yeah I am Ava")
+    messages = build_chat_messages({"messages": [persona(), opener, user]})
+    assert [m.content for m in messages] == ["You are Orion.", opener.content, user.content]
+
+def test_history_within_budget_is_unchanged():
+    history = [AIMessage(content="opener")] + turns(3)
+    assert trim_history(history, budget=10_000) == history
+
+def test_over_budget_keeps_recent_whole_turns_starting_on_a_user_message():
+    history = [AIMessage(content="opener")] + turns(10)
+    trimmed = trim_history(history, budget=300)
+    assert 0 < len(trimmed) < len(history)
+    assert isinstance(trimmed[0], HumanMessage)
+    assert trimmed == history[-len(trimmed):]
+
+def test_latest_user_turn_survives_a_tiny_budget():
+    history = turns(3, words=500)
+    trimmed = trim_history(history, budget=10)
+    assert trimmed[0].id == "h2"
+
+def test_summary_and_lore_wrap_the_history():
+    state = {"messages": [persona()] + turns(1), "summary": "They met at the gym.", "lore": "The Bloom Rite."}
+    contents = [m.content for m in build_chat_messages(state)]
+    assert contents[1] == "Summary of the earlier conversation: They met at the gym."
+    assert contents[-1] == "Relevant lore: The Bloom Rite."
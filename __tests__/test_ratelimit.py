@@ -0,0 +1,193 @@
+from ratelimit import CircuitBreaker, CircuitOpen, ProviderGuard, RateLimited, TokenBucket
+
+import asyncio, pytest, time
+
+async def ok():
+    return "ok"
+
+async def boom():
+    raise RuntimeError("provider 500")
+
+class Reply:
+    def __init__(self, total_tokens):
+        self.usage_metadata = {"total_tokens": total_tokens}
+
+#? Token bucket
+@pytest.mark.asyncio
+async def test_bucket_waits_within_deadline():
+    bucket = TokenBucket(600)  # 10 per second
+    bucket.level = 0
+    start = time.monotonic()
+    await bucket.acquire(1, start + 1)
+    assert 0.08 <= time.monotonic() - start < 0.5
+
+@pytest.mark.asyncio
+async def test_bucket_fails_fast_past_deadline():
+    bucket = TokenBucket(60)  # 1 per second
+    bucket.level = 0
+    start = time.monotonic()
+    with pytest.raises(RateLimited):
+        await bucket.acquire(1, start + 0.1)
+    assert time.monotonic() - start < 0.05  # refused without sleeping out the deadline
+
+@pytest.mark.asyncio
+async def test_bucket_oversized_request_takes_whole_budget():
+    bucket = TokenBucket(100)
+    await bucket.acquire(10_000, time.monotonic())
+    assert bucket.level < 1
+
+def test_bucket_adjust_refunds_up_to_capacity_and_goes_negative():
+    bucket = TokenBucket(100)
+    bucket.adjust(-50)
+    assert bucket.level == 100
+    bucket.adjust(150)
+    assert bucket.level < 0
+
+@pytest.mark.asyncio
+async def test_bucket_serves_waiters_in_arrival_order():
+    bucket = TokenBucket(600)
+    bucket.level = 0
+    order = []
+
+    async def take(i, amount):
+        await bucket.acquire(amount, time.monotonic() + 2)
+        order.append(i)
+
+    # A big request first must not be overtaken by the small ones behind it
+    await asyncio.gather(take(0, 3), take(1, 1), take(2, 1))
+    assert order == [0, 1, 2]
+
+#? Circuit breaker
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failures=3, reset_after=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(ok=False)
+    breaker.before_call()
+    breaker.record(ok=True)  # a success resets the count
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record(ok=False)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+
+def test_breaker_half_open_allows_one_trial():
+    breaker = CircuitBreaker(failures=1, reset_after=0)
+    breaker.before_call()
+    breaker.record(ok=False)
+    breaker.before_call()  # cooldown over: the trial call
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpen):
+        breaker.before_call()
+    breaker.record(ok=True)
+    assert breaker.state == "closed" and breaker.failures == 0
+
+def test_breaker_failed_trial_reopens():
+    breaker = CircuitBreaker(failures=5, reset_after=0)
+    breaker.state = "open"
+    breaker.before_call()
+    breaker.record(ok=False)
+    assert breaker.state == "open"
+
+def test_breaker_release_frees_the_trial_slot():
+    breaker = CircuitBreaker(failures=1, reset_after=0)
+    breaker.state = "open"
+    breaker.before_call()
+    breaker.release()  # cancelled trial: neither outcome
+    assert breaker.state == "half_open"
+    breaker.before_call()
+
+#? Guard
+@pytest.mark.asyncio
+async def test_guard_refunds_earlier_buckets_when_a_later_one_refuses():
+    guard = ProviderGuard({"openai": {"rpm": 60}}, {"gpt": {"rpm": 60}}, 0.01, 3, 30)
+    guard._buckets[("gpt", "rpm")].level = 0
+    with pytest.raises(RateLimited):
+        await guard.call("openai", "gpt", 10, ok)
+    assert guard._buckets[("openai", "rpm")].level == pytest.approx(60, abs=0.1)
+    # Refusing on budget is not a provider failure
+    assert guard.breaker("openai").failures == 0
+
+@pytest.mark.asyncio
+async def test_guard_settles_token_estimate_against_usage():
+    guard = ProviderGuard({"openai": {"tpm": 1000}}, {"gpt": {"tpm": 1000}}, 1, 3, 30)
+
+    async def call():
+        return Reply(total_tokens=50)
+
+    await guard.call("openai", "gpt", 300, call)
+    for scope in ("openai", "gpt"):
+        assert guard._buckets[(scope, "tpm")].level == pytest.approx(950, abs=1)
+
+@pytest.mark.asyncio
+async def test_guard_splits_limits_across_workers():
+    guard = ProviderGuard({"openai": {"rpm": 500, "tpm": 0}}, {}, 1, 3, 30, share=4)
+    assert guard._buckets[("openai", "rpm")].capacity == 125
+    assert ("openai", "tpm") not in guard._buckets
+
+@pytest.mark.asyncio
+async def test_guard_opens_circuit_and_fails_fast():
+    guard = ProviderGuard({}, {}, 1, 2, 60)
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            await guard.call("deepseek", "ds", 1, boom)
+    with pytest.raises(CircuitOpen):
+        await guard.call("deepseek", "ds", 1, ok)
+    assert await guard.call("openai", "gpt", 1, ok) == "ok"  # other providers are unaffected
+    assert guard.stats()["breakers"]["deepseek"] == {"state": "open", "failures": 2}
+
+@pytest.mark.asyncio
+async def test_guard_cancelled_call_is_not_a_failure():
+    guard = ProviderGuard({}, {}, 1, 1, 60)
+    task = asyncio.ensure_future(guard.call("openai", "gpt", 1, lambda: asyncio.sleep(1)))
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert guard.breaker("openai").state == "closed"
+    assert await guard.call("openai", "gpt", 1, ok) == "ok"
+
+@pytest.mark.asyncio
+async def test_guard_retries_transient_failures_through_the_budget():
+    guard = ProviderGuard({"openai": {"rpm": 60}}, {}, 1, 5, 60, retry_backoff=0.01)
+    attempts = []
+
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise RuntimeError("provider 503")
+        return "ok"
+
+    assert await guard.call("openai", "gpt", 1, flaky, retries=1) == "ok"
+    assert len(attempts) == 2
+    # Both attempts were charged, and the success reset the breaker
+    assert guard._buckets[("openai", "rpm")].level == pytest.approx(58, abs=0.1)
+    assert guard.breaker("openai").failures == 0
+
+@pytest.mark.asyncio
+async def test_guard_gives_up_after_retries():
+    guard = ProviderGuard({}, {}, 1, 5, 60, retry_backoff=0.01)
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise RuntimeError("provider 503")
+
+    with pytest.raises(RuntimeError):
+        await guard.call("openai", "gpt", 1, failing, retries=2)
+    assert len(attempts) == 3
+
+@pytest.mark.asyncio
+async def test_guard_does_not_retry_into_an_open_circuit():
+    guard = ProviderGuard({}, {}, 1, 1, 60, retry_backoff=0.01)
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        raise RuntimeError("provider 503")
+
+    # The first failure opens the circuit, so the retry is refused instead of reaching the provider
+    with pytest.raises(CircuitOpen):
+        await guard.call("openai", "gpt", 1, failing, retries=3)
+    assert len(attempts) == 1
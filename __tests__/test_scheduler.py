@@ -0,0 +1,133 @@
+from scheduler import HedgedScheduler, ProviderStats
+
+import asyncio, pytest, time
+
+class FakeProvider:
+    """Answers after `latency` seconds, or raises if `error` is set; records when it was called and cancelled."""
+    def __init__(self, name, latency=0.0, error=None):
+        self.name = name
+        self.latency = latency
+        self.error = error
+        self.calls = []
+        self.cancelled = 0
+
+    async def __call__(self, prompt):
+        self.calls.append(time.monotonic())
+        try:
+            await asyncio.sleep(self.latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.error:
+            raise RuntimeError(self.error)
+        return f"{self.name}:{prompt}"
+
+def scheduler(primary, secondary, **kwargs):
+    kwargs = {"default_hedge_delay": 0.05, "min_samples": 3, "timeout": 1, **kwargs}
+    return HedgedScheduler({primary.name: primary, secondary.name: secondary}, **kwargs)
+
+@pytest.mark.asyncio
+async def test_fast_primary_wins_without_hedging():
+    primary, secondary = FakeProvider("ds", 0.01), FakeProvider("gpt")
+    assert await scheduler(primary, secondary).run("hi") == ("ds:hi", "ds")
+    assert secondary.calls == []
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_after_delay_and_cancelled():
+    primary, secondary = FakeProvider("ds", 0.5), FakeProvider("gpt", 0.01)
+    start = time.monotonic()
+    assert await scheduler(primary, secondary).run("hi") == ("gpt:hi", "gpt")
+    assert 0.04 <= secondary.calls[0] - start < 0.2
+    await asyncio.sleep(0)
+    assert primary.cancelled == 1
+
+@pytest.mark.asyncio
+async def test_primary_error_hedges_immediately():
+    primary, secondary = FakeProvider("ds", error="503"), FakeProvider("gpt", 0.01)
+    start = time.monotonic()
+    assert await scheduler(primary, secondary, default_hedge_delay=10).run("hi") == ("gpt:hi", "gpt")
+    assert secondary.calls[0] - start < 0.05
+
+@pytest.mark.asyncio
+async def test_all_providers_failing_raises_last_error():
+    primary, secondary = FakeProvider("ds", error="first"), FakeProvider("gpt", error="second")
+    with pytest.raises(RuntimeError, match="second"):
+        await scheduler(primary, secondary).run("hi")
+
+@pytest.mark.asyncio
+async def test_timeout_cancels_everything_in_flight():
+    primary, secondary = FakeProvider("ds", 5), FakeProvider("gpt", 5)
+    start = time.monotonic()
+    with pytest.raises(asyncio.TimeoutError):
+        await scheduler(primary, secondary, timeout=0.2).run("hi")
+    assert time.monotonic() - start < 0.4
+    await asyncio.sleep(0)
+    assert primary.cancelled == 1 and secondary.cancelled == 1
+
+@pytest.mark.asyncio
+async def test_cancelling_the_run_cancels_provider_calls():
+    primary, secondary = FakeProvider("ds", 5), FakeProvider("gpt", 5)
+    run = asyncio.ensure_future(scheduler(primary, secondary).run("hi"))
+    await asyncio.sleep(0.1)  # past the hedge delay, both in flight
+    run.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run
+    await asyncio.sleep(0)
+    assert primary.cancelled == 1 and secondary.cancelled == 1
+
+@pytest.mark.asyncio
+async def test_failing_primary_is_demoted_and_can_recover():
+    primary, secondary = FakeProvider("ds", error="503"), FakeProvider("gpt", 0.01)
+    hedged = scheduler(primary, secondary, min_samples=3, max_error_rate=0.5, window=4)
+    for _ in range(3):
+        await hedged.run("hi")
+    assert hedged.ranked() == ["gpt", "ds"]
+    assert hedged.snapshot()["ds"]["demoted"] is True
+
+    # Still sampled from hedge position; successes push its error rate back down
+    primary.error, primary.latency, secondary.latency = None, 0.01, 0.5
+    for _ in range(3):
+        await hedged.run("hi")
+    assert hedged.ranked() == ["ds", "gpt"]
+
+@pytest.mark.asyncio
+async def test_hedge_delay_tracks_observed_latency():
+    primary, secondary = FakeProvider("ds", 0.02), FakeProvider("gpt")
+    hedged = scheduler(primary, secondary, default_hedge_delay=9, min_samples=3)
+    assert hedged.hedge_delay("ds") == 9
+    for _ in range(3):
+        await hedged.run("hi")
+    assert 0.02 <= hedged.hedge_delay("ds") < 0.1
+
+def test_provider_stats_percentile_and_error_rate():
+    stats = ProviderStats(window=10)
+    for latency in (0.1, 0.2, 0.3, 0.4):
+        stats.record(latency, ok=True)
+    stats.record(5, ok=False)  # failures count towards the error rate, not latency
+    assert stats.percentile(0.5) == 0.3
+    assert stats.percentile(0.99) == 0.4
+    assert stats.error_rate == pytest.approx(0.2)
+    assert ProviderStats(window=10).percentile(0.9) is None
+
+@pytest.mark.asyncio
+async def test_hedge_delay_does_not_shrink_under_repeated_hedging():
+    # The primary is fast half the time and slow the other half; the slow calls always lose to the hedge.
+    # Counting only completed calls would pull the delay down to the fast mode and hedge nearly every call
+    primary, secondary = FakeProvider("ds"), FakeProvider("gpt", 0.005)
+    hedged = scheduler(primary, secondary, default_hedge_delay=0.05, min_samples=4, hedge_percentile=0.9)
+    for i in range(12):
+        primary.latency = 0.01 if i % 2 else 0.2
+        await hedged.run("hi")
+    assert hedged.hedge_delay("ds") >= 0.05
+    assert hedged.stats["ds"].error_rate == 0  # lost hedges aren't errors
+
+@pytest.mark.asyncio
+async def test_cancelled_run_records_no_latency():
+    primary, secondary = FakeProvider("ds", 5), FakeProvider("gpt", 5)
+    hedged = scheduler(primary, secondary)
+    run = asyncio.ensure_future(hedged.run("hi"))
+    await asyncio.sleep(0.01)
+    run.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await run
+    assert not hedged.stats["ds"].latencies
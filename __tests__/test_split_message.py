@@ -0,0 +1,64 @@
+from helper import split_message
+
+import pytest
+
+def bubbles(text: str, split_count: int):
+    return split_message(text, split_count).split("---")
+
+def test_no_split_for_zero_count_or_short_text():
+    assert split_message("Hey. You new here?", 2) == "Hey. You new here?"
+    text = "Hey there. Didn't see you come in. You new around here?"
+    assert split_message(text, 0) == text
+
+def test_splits_at_sentence_boundaries():
+    text = "Hey there, didn't see you. You new around here? I train most nights, so I know the place."
+    assert bubbles(text, 2) == ["Hey there, didn't see you.", "You new around here?", "I train most nights, so I know the place."]
+
+def test_never_more_bubbles_than_requested():
+    text = "One. Two. Three. Four. Five. Six. Seven. Eight. Nine. Ten. Eleven."
+    for split_count in range(4):
+        assert len(bubbles(text, split_count)) == split_count + 1
+
+def test_picks_boundaries_that_even_out_bubbles():
+    text = "Short one. " + "This sentence is a fair bit longer than the first. " + "Then a closing line of similar length to it."
+    parts = bubbles(text, 1)
+    assert parts == ["Short one. This sentence is a fair bit longer than the first.", "Then a closing line of similar length to it."]
+
+def test_falls_back_to_clauses():
+    text = "I was going to head out early tonight, but then you walked in, so here we are"
+    assert bubbles(text, 2) == ["I was going to head out early tonight,", "but then you walked in,", "so here we are"]
+
+def test_never_splits_inside_roleplay_actions():
+    text = "*leans on the bag. Smirks. Waits.* So, you looking to get started or just scoping the place out?"
+    assert bubbles(text, 1) == ["*leans on the bag. Smirks. Waits.*", "So, you looking to get started or just scoping the place out?"]
+
+def test_text_is_preserved():
+    text = "Hey there! Nice to meet you too. Let me send you a pic of what I'm doing right now, ok?"
+    for split_count in range(4):
+        assert " ".join(bubbles(text, split_count)) == text
+
+@pytest.mark.parametrize("text, expected", [
+    (
+        "Mr. Smith trains here most nights. Dr. Who only shows up on weekends, go figure.",
+        ["Mr. Smith trains here most nights.", "Dr. Who only shows up on weekends, go figure."],
+    ),
+    (
+        "Coach told me to try compound lifts, e.g. squats and deadlifts. Honestly it works.",
+        ["Coach told me to try compound lifts, e.g. squats and deadlifts.", "Honestly it works."],
+    ),
+    (
+        "I spotted J. Smith on the bench press today. He is getting strong, fast.",
+        ["I spotted J. Smith on the bench press today.", "He is getting strong, fast."],
+    ),
+])
+def test_abbreviations_and_initials_do_not_end_sentences(text, expected):
+    assert bubbles(text, 1) == expected
+
+def test_abbreviation_only_text_falls_back_to_clauses():
+    # With no real sentence end to use, "Dr." still isn't picked
+    text = "Ask Dr. Who about the routine, he knows it better than anyone here"
+    assert bubbles(text, 1) == ["Ask Dr. Who about the routine,", "he knows it better than anyone here"]
+
+def test_custom_separator():
+    text = "Hey there, didn't see you. You new around here? I train most nights, so I know the place."
+    assert split_message(text, 1, separator="\n").count("\n") == 1
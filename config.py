@@ -1,4 +1,4 @@
-import os
+import json, os
 
 app_env = os.getenv("APP_ENV", "development")
 
@@ -10,3 +10,95 @@ elif app_env == "prod":
     CORS_ORIGINS = ["https://portfolio-phi-mocha-72.vercel.app/"]
 else:
     raise ValueError(f"Unknown environment: {app_env}")
+
+#? Retrieval
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "pinecone")  # "pinecone" or "local"
+EMBEDDINGS_BACKEND = os.getenv("EMBEDDINGS_BACKEND", "openai")  # "openai" or "stub" (offline, deterministic)
+EMBEDDING_MODEL = "text-embedding-3-large"
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", os.path.join(os.path.dirname(__file__), "data", "index", "lore"))
+RAG_POOL_CONNECTIONS = int(os.getenv("RAG_POOL_CONNECTIONS", "10"))  # keep-alive connections per client
+RAG_WARM_UP = os.getenv("RAG_WARM_UP", "true").lower() == "true"
+RAG_MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "8"))  # lookups allowed in flight at once
+RAG_QUEUE_TIMEOUT = float(os.getenv("RAG_QUEUE_TIMEOUT", "5"))  # seconds to wait for a slot before giving up
+RAG_CACHE_SIZE = int(os.getenv("RAG_CACHE_SIZE", "256"))  # cached queries per top_k
+RAG_CACHE_TTL = float(os.getenv("RAG_CACHE_TTL", "3600"))
+RAG_CACHE_THRESHOLD = float(os.getenv("RAG_CACHE_THRESHOLD", "0.95"))  # cosine similarity for a semantic hit
+LORE_INJECT_THRESHOLD = float(os.getenv("LORE_INJECT_THRESHOLD", "0.6"))  # top score at or above: inject without validating
+LORE_DROP_THRESHOLD = float(os.getenv("LORE_DROP_THRESHOLD", "0.3"))  # top score below: skip lore; in between asks the validator
+
+#? Model clients
+MODEL_WARM_UP = os.getenv("MODEL_WARM_UP", "true").lower() == "true"  # build clients in the background at startup, else on first use
+
+#? Provider rate limits and circuit breaker
+# Requests / tokens per minute for the whole deployment, split evenly across workers. 0 or missing = unlimited
+PROVIDER_RATE_LIMITS = json.loads(os.getenv("PROVIDER_RATE_LIMITS", '{"openai": {"rpm": 500, "tpm": 200000}, "deepseek": {}}'))
+MODEL_RATE_LIMITS = json.loads(os.getenv("MODEL_RATE_LIMITS", "{}"))  # same shape, keyed by model name, on top of the provider's
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "5"))  # seconds a call may queue for budget before failing fast
+MODEL_MAX_RETRIES = int(os.getenv("MODEL_MAX_RETRIES", "0"))  # SDK retries per call, outside the budgets and the breaker
+# Retries for calls with no hedge to fall back on (validators, splitter, summarizer); each goes through the budgets and breaker
+UNHEDGED_RETRIES = int(os.getenv("UNHEDGED_RETRIES", "1"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))  # consecutive failed calls that open a provider's circuit
+BREAKER_RESET = float(os.getenv("BREAKER_RESET", "30"))  # seconds a circuit stays open before one trial call is let through
+
+#? Chat provider scheduling
+CHAT_TIMEOUT = float(os.getenv("CHAT_TIMEOUT", "30"))  # give up on the turn after this many seconds
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.9"))  # hedge once the primary is slower than this percentile
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "9"))  # until enough latency samples exist
+
+#? Tools
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "10"))  # per tool call, a slow tool becomes an error result
+
+#? Message splitting
+SPLITTER_MODE = os.getenv("SPLITTER_MODE", "llm")  # "llm" (extra model call) or "local" (rule based, no model call)
+
+#? Conversation history
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))  # approx tokens of history sent per model call
+HISTORY_SUMMARY = os.getenv("HISTORY_SUMMARY", "false").lower() == "true"  # roll old turns into a running summary
+HISTORY_SUMMARY_TRIGGER = int(os.getenv("HISTORY_SUMMARY_TRIGGER", "6000"))  # stored history size that triggers it
+
+#? Serving
+WEB_CONCURRENCY = max(int(os.getenv("WEB_CONCURRENCY", "1")), 1)  # worker processes, each with its own pool, graph and clients
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+GRACEFUL_SHUTDOWN_TIMEOUT = float(os.getenv("GRACEFUL_SHUTDOWN_TIMEOUT", "30"))  # seconds in-flight turns get to finish on shutdown
+
+#? Admission control (per worker)
+MAX_ACTIVE_TURNS = int(os.getenv("MAX_ACTIVE_TURNS", "32"))  # graph runs in flight at once, 0 disables the limit
+MAX_QUEUED_TURNS = int(os.getenv("MAX_QUEUED_TURNS", "64"))  # turns waiting for a slot before new ones get 429
+TURN_QUEUE_TIMEOUT = float(os.getenv("TURN_QUEUE_TIMEOUT", "5"))  # seconds to wait for a slot before 503
+MAX_QUEUED_PER_THREAD = int(os.getenv("MAX_QUEUED_PER_THREAD", "4"))  # requests waiting behind one chat's running turn before 429
+THREAD_QUEUE_TIMEOUT = float(os.getenv("THREAD_QUEUE_TIMEOUT", "30"))  # seconds a request waits behind its chat's running turn before 503
+TURN_MERGE_WINDOW = float(os.getenv("TURN_MERGE_WINDOW", "0"))  # seconds to gather rapid-fire /chat messages into one turn, 0 disables
+
+#? Postgres connection pool
+DB_POOL_BUDGET = int(os.getenv("DB_POOL_BUDGET", "0"))  # connections across all workers, split evenly; 0 = DB_POOL_MAX_SIZE per worker
+if DB_POOL_BUDGET > 0:
+    DB_POOL_MAX_SIZE = max(DB_POOL_BUDGET // WEB_CONCURRENCY, 1)
+else:
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))
+DB_POOL_MIN_SIZE = min(int(os.getenv("DB_POOL_MIN_SIZE", "2")), DB_POOL_MAX_SIZE)  # opened and kept warm at startup
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))  # seconds to wait for a connection before answering 503
+DB_POOL_MAX_WAITING = int(os.getenv("DB_POOL_MAX_WAITING", "0"))  # queued requests before rejecting outright, 0 = no limit
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "300"))
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))
+
+#? Checkpointing
+CHECKPOINTER = os.getenv("CHECKPOINTER", "postgres")  # "postgres" or "memory" (in-process, for offline runs and benchmarks)
+CHECKPOINT_MODE = os.getenv("CHECKPOINT_MODE", "turn")  # "turn" persists once per /chat turn, "step" after every node
+# Hot threads kept in memory, 0 disables the cache. Opt in only when a thread's turns always reach the same process
+# (one worker, one replica or sticky routing): a turn served elsewhere leaves this copy stale, and the next write
+# on top of it would drop that turn
+THREAD_CACHE_SIZE = int(os.getenv("THREAD_CACHE_SIZE", "0"))
+THREAD_CACHE_TTL = float(os.getenv("THREAD_CACHE_TTL", "600"))
+
+#? Thread cleanup
+THREAD_IDLE_TTL = float(os.getenv("THREAD_IDLE_TTL", "86400"))  # seconds without a checkpoint before a thread is wiped, 0 disables
+SWEEP_INTERVAL = float(os.getenv("SWEEP_INTERVAL", "900"))
+SWEEP_BATCH_SIZE = int(os.getenv("SWEEP_BATCH_SIZE", "500"))
+
+#? /identify
+IDENTITY_CACHE_SIZE = int(os.getenv("IDENTITY_CACHE_SIZE", "1024"))
+IDENTITY_CACHE_TTL = float(os.getenv("IDENTITY_CACHE_TTL", "600"))
+
+#? Observability
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()  # structured JSON logs; DEBUG adds per-node detail
@@ -0,0 +1,74 @@
+from fakes import offline_env
+
+offline_env()
+
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from checkpoint import BufferedCheckpointSaver
+from helper import init_vector_store, ValidateLore
+
+import asyncio, build_graph
+
+# Checkpoint writes per /chat turn, per-step checkpointing vs BufferedCheckpointSaver (CHECKPOINT_MODE=turn).
+# Each turn takes the longest path: chatbot -> tools -> lore_rag -> chatbot -> splitter.
+TURNS = 5
+
+class CountingSaver(MemorySaver):
+    def __init__(self):
+        super().__init__()
+        self.put_calls = 0
+        self.write_calls = 0
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        self.put_calls += 1
+        return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        self.write_calls += 1
+        return await super().aput_writes(config, writes, task_id, task_path)
+
+async def fake_chatbot(messages, **kwargs):
+    last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+    if not any(isinstance(m, ToolMessage) for m in messages[last_human:]):
+        return AIMessage(content="", tool_calls=[{"name": "get_lore", "args": {}, "id": f"call_{uuid4().hex}"}])
+    return AIMessage(content="The Bloom Rite? It's where every celestial starts. Ask me about it after training.")
+
+class FakeValidator:
+    async def ainvoke(self, messages, **kwargs):
+        return ValidateLore(is_necessary=True)
+
+class FakeSplitter:
+    async def ainvoke(self, messages, **kwargs):
+        return AIMessage(content="It's where every celestial starts.---Ask me about it after training.")
+
+build_graph.chat_scheduler.providers = {"deepseek": fake_chatbot, "openai": fake_chatbot}
+build_graph.gpt_lorebot = FakeValidator()
+build_graph.splitter = FakeSplitter()
+
+async def run(mode: str):
+    counter = CountingSaver()
+    saver = BufferedCheckpointSaver(counter) if mode == "turn" else counter
+    graph = build_graph.graph_builder.compile(checkpointer=saver)
+    config = {"configurable": {"thread_id": f"bench-{mode}"}}
+    for i in range(TURNS):
+        state = {"messages": [{"role": "user", "content": f"what is the bloom rite? ({i})"}], "user_id": "bench"}
+        if mode == "turn":
+            async with saver.turn("bench-turn"):
+                await graph.ainvoke(state, config)
+        else:
+            await graph.ainvoke(state, config)
+    final = await graph.aget_state(config)
+    return counter.put_calls / TURNS, counter.write_calls / TURNS, len(final.values["messages"])
+
+async def main():
+    await init_vector_store()
+    print(f"{'mode':<6}{'puts/turn':>11}{'writes/turn':>13}{'messages':>10}")
+    for mode in ("step", "turn"):
+        puts, writes, messages = await run(mode)
+        print(f"{mode:<6}{puts:>11.1f}{writes:>13.1f}{messages:>10}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,58 @@
+import asyncio
+import math
+import os
+import random
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+# Offline setup shared by the benchmarks: stub embedder, local index, fake model calls. No API keys or network.
+def offline_env():
+    """Point retrieval at a stub-embedded local index of the lore files. Call before importing app modules."""
+    index_path = os.path.join(tempfile.mkdtemp(prefix="bench_index_"), "lore")
+    os.environ.update({
+        "RETRIEVER_BACKEND": "local",
+        "EMBEDDINGS_BACKEND": "stub",
+        "LOCAL_INDEX_PATH": index_path,
+        "RAG_WARM_UP": "false",
+        "THREAD_IDLE_TTL": "0",
+        "CHECKPOINTER": "memory",
+    })
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+
+    from retrievers import build_local_index, StubEmbeddings
+
+    stellarbloom = os.path.join(ROOT, "data", "stellarbloom")
+    records = []
+    for file_name in sorted(os.listdir(stellarbloom)):
+        with open(os.path.join(stellarbloom, file_name), "r", encoding="utf-8") as file:
+            source = os.path.splitext(file_name)[0]
+            records.append({"id": source, "text": file.read(), "metadata": {"source": source}})
+    build_local_index(index_path, records, StubEmbeddings())
+
+def parse_latency(spec: str):
+    """"fixed:S", "uniform:LO,HI" or "lognormal:MEDIAN,SIGMA" (seconds) -> a function sampling one delay."""
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value]
+    if kind == "fixed":
+        return lambda: values[0]
+    elif kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    elif kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+class FakeChatModel:
+    """Stands in for a ChatOpenAI/ChatDeepSeek client: waits a sampled latency, then returns `respond(messages)`."""
+    def __init__(self, latency: str, respond):
+        self.sample = parse_latency(latency)
+        self.respond = respond
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.sample())
+        return self.respond(messages)
@@ -0,0 +1,127 @@
+from fakes import FakeChatModel, offline_env, parse_latency
+
+offline_env()
+
+from collections import defaultdict
+from uuid import uuid4
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.utils.runnable import RunnableCallable
+
+from helper import Identify, ValidateLore
+from instrumentation import timed_llm
+
+import argparse, asyncio, httpx, random, time
+import build_graph, independents, main
+
+# Boots the FastAPI app in-process (lifespan included) on fake models, the stub-embedded local index and an
+# in-memory checkpointer, then drives N concurrent users through /chat (or /chat/stream) over ASGI.
+# Reports request latency percentiles, throughput and time spent in each graph node.
+#   python scripts/bench/load_test.py --users 50 --turns 5 --deepseek lognormal:1.5,0.4 --openai lognormal:1,0.3
+REPLY = "The Bloom Rite? It's where every celestial starts. You'd swear your oath at dawn. Ask me about it after training, yeah?"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Offline load test of /chat on fake models")
+    parser.add_argument("--users", type=int, default=20, help="concurrent users, each with its own thread")
+    parser.add_argument("--turns", type=int, default=5, help="messages sent by each user, one after the other")
+    parser.add_argument("--endpoint", choices=["chat", "stream"], default="chat")
+    parser.add_argument("--think-time", default="uniform:0,0.5", help="pause between a user's turns")
+    parser.add_argument("--deepseek", default="lognormal:1.2,0.4", help="chatbot latency, primary provider")
+    parser.add_argument("--openai", default="lognormal:0.9,0.3", help="chatbot latency, hedge provider")
+    parser.add_argument("--validator", default="lognormal:0.5,0.3", help="lore and identity validator latency")
+    parser.add_argument("--splitter", default="lognormal:0.7,0.3", help="splitter model latency (SPLITTER_MODE=llm)")
+    parser.add_argument("--summarizer", default="lognormal:1,0.3", help="summarizer latency (HISTORY_SUMMARY=true)")
+    parser.add_argument("--tool-rate", type=float, default=0.3, help="share of turns where the chatbot calls get_lore")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+def chatbot_reply(tool_rate: float):
+    def respond(messages):
+        last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        used_tool = any(isinstance(m, ToolMessage) for m in messages[last_human:])
+        if not used_tool and random.random() < tool_rate:
+            return AIMessage(content="", tool_calls=[{"name": "get_lore", "args": {}, "id": f"call_{uuid4().hex}"}])
+        return AIMessage(content=REPLY)
+    return respond
+
+def install_fakes(args):
+    """Swap every provider client the graph and /identify use for a FakeChatModel."""
+    build_graph.chat_scheduler.providers = {
+        "deepseek": timed_llm("deepseek", FakeChatModel(args.deepseek, chatbot_reply(args.tool_rate)).ainvoke, chat=True),
+        "openai": timed_llm("openai", FakeChatModel(args.openai, chatbot_reply(args.tool_rate)).ainvoke, chat=True),
+    }
+    build_graph.gpt_lorebot = FakeChatModel(args.validator, lambda messages: ValidateLore(is_necessary=True))
+    build_graph.splitter = FakeChatModel(args.splitter, lambda messages: AIMessage(content=REPLY.replace("? ", "?---", 1)))
+    build_graph.summarizer = FakeChatModel(args.summarizer, lambda messages: AIMessage(content="They talked about the gym."))
+    independents.identity_validator = FakeChatModel(args.validator, lambda messages: Identify(is_valid=True))
+
+def time_nodes(timings: dict):
+    """Wrap each registered node so every run of it records its wall time, before lifespan compiles the graph."""
+    def timed(name, runnable):
+        async def run(state, config):
+            start = time.perf_counter()
+            try:
+                return await runnable.ainvoke(state, config)
+            finally:
+                timings[name].append(time.perf_counter() - start)
+        return RunnableCallable(None, run, name=name)
+
+    nodes = build_graph.graph_builder.nodes
+    for name, spec in nodes.items():
+        nodes[name] = spec._replace(runnable=timed(name, spec.runnable))
+
+def percentile(values: list, q: float):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)] if ordered else float("nan")
+
+async def user(client: httpx.AsyncClient, args, think_time, latencies: list, errors: list):
+    user_id = f"bench-{uuid4().hex[:8]}"
+    for turn in range(args.turns):
+        payload = {"user_id": user_id, "user_input": f"what is the bloom rite? ({turn})", "name": "Ava", "bot_name": "Orion"}
+        start = time.perf_counter()
+        try:
+            if args.endpoint == "chat":
+                response = await client.post("/chat", json=payload)
+                response.raise_for_status()
+            else:
+                async with client.stream("POST", "/chat/stream", json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if '"type": "error"' in line:
+                            raise RuntimeError(line)
+            latencies.append(time.perf_counter() - start)
+        except Exception as e:
+            errors.append(e)
+        await asyncio.sleep(think_time())
+
+async def run(args):
+    random.seed(args.seed)
+    install_fakes(args)
+    timings = defaultdict(list)
+    time_nodes(timings)
+    latencies, errors = [], []
+
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            start = time.perf_counter()
+            await asyncio.gather(*[
+                user(client, args, parse_latency(args.think_time), latencies, errors) for _ in range(args.users)
+            ])
+            elapsed = time.perf_counter() - start
+
+    print(f"{args.users} users x {args.turns} turns on /{args.endpoint}: {len(latencies)} ok, {len(errors)} failed in {elapsed:.1f}s")
+    print(f"throughput {len(latencies) / elapsed:.2f} turns/s")
+    print(f"latency    p50 {percentile(latencies, 0.5):.3f}s  p95 {percentile(latencies, 0.95):.3f}s  p99 {percentile(latencies, 0.99):.3f}s")
+    print(f"\n{'node':<10}{'runs':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'total s':>10}")
+    for name, values in sorted(timings.items()):
+        print(
+            f"{name:<10}{len(values):>7}{percentile(values, 0.5):>9.3f}{percentile(values, 0.95):>9.3f}"
+            f"{percentile(values, 0.99):>9.3f}{sum(values):>10.1f}"
+        )
+    print("\nproviders", build_graph.chat_scheduler.snapshot())
+    for error in errors[:5]:
+        print("❌", repr(error))
+
+if __name__ == "__main__":
+    asyncio.run(run(parse_args()))
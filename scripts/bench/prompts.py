@@ -0,0 +1,57 @@
+from fakes import offline_env
+
+offline_env()
+
+from helper import clean_prompt, create_prompt
+
+import random, timeit
+
+# create_prompt cost per call, registry (templates cleaned at import, persona memoized) vs the old per-call f-string + clean.
+# Also checks that both produce the same prompt text.
+CALLS = 20000
+
+def legacy_prompt(info: list, llm_type: str):
+    if llm_type == "chatbot":
+        prompt = f"""
+        User's name: {info[0]}
+        You are {info[1]}.
+        You are a celestial and a fitness mentor. You speak like a normal human, not going out of your way to help but also being supportive.
+        You are playing a part of a narrative where you want to build your relationship with the user slowly but surely.
+        """
+    elif llm_type == "lore_validator":
+        prompt = f"""
+        User Question: {info[0]}\\n
+        Lore retrieved: {info[1]}
+        """
+    elif llm_type == "identity_validator":
+        prompt = f"""
+        Check if user has provided a valid name, age and email in the message.
+        User Message: {info[0]}
+        """
+    elif llm_type == "summarizer":
+        prompt = f"""
+        Update the running summary of this roleplay conversation with the new messages below.
+        Keep the user's details, what they shared, how the relationship has progressed and any open threads. Stay under 150 words.\\n
+        Current summary: {info[0]}\\n
+        New messages: {info[1]}
+        """
+    return clean_prompt(prompt)
+
+CASES = {
+    "chatbot": ["Ava", "Orion"],
+    "lore_validator": ["what is the bloom rite?", "The Bloom Rite is held every spring.\nNew celestials  swear their oath."],
+    "identity_validator": ["I'm Ava, 21, ava@example.com"],
+    "summarizer": ["Ava joined the gym.", "Human: hey\nAI: hey, new here?"],
+}
+
+def main():
+    random.seed(0)
+    print(f"{'llm_type':<20}{'legacy us':>11}{'registry us':>13}{'speedup':>9}  same")
+    for llm_type, info in CASES.items():
+        same = legacy_prompt(info, llm_type) == create_prompt(info, llm_type)
+        legacy = timeit.timeit(lambda: legacy_prompt(info, llm_type), number=CALLS) / CALLS * 1e6
+        registry = timeit.timeit(lambda: create_prompt(info, llm_type), number=CALLS) / CALLS * 1e6
+        print(f"{llm_type:<20}{legacy:>11.2f}{registry:>13.2f}{legacy / registry:>8.1f}x  {same}")
+
+if __name__ == "__main__":
+    main()
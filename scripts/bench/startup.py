@@ -0,0 +1,45 @@
+from fakes import offline_env, ROOT
+
+offline_env()
+
+import json, os, statistics, subprocess, sys
+
+# Cold start of the app, each sample in a fresh interpreter: `import main`, lifespan until ready to serve
+# (offline: local index, in-memory checkpointer), then building every model client through the registry.
+# Run it before and after touching imports in src/ to catch regressions.
+RUNS = 5
+
+CHILD = """
+import asyncio, json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+heavy = [m for m in ("openai", "langchain_openai", "langchain_deepseek", "pinecone") if m in sys.modules]
+
+async def boot():
+    async with main.app.router.lifespan_context(main.app):
+        ready = time.perf_counter()
+        main.models.warm_up()
+        return ready, time.perf_counter()
+
+ready, built = asyncio.run(boot())
+print(json.dumps({"import": imported - start, "lifespan": ready - imported, "models": built - ready, "heavy": heavy}))
+"""
+
+def sample(env: dict):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD], env=env, cwd=os.path.join(ROOT, "src"), capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([ROOT, os.path.join(ROOT, "src")]), "MODEL_WARM_UP": "false"}
+    samples = [sample(env) for _ in range(RUNS)]
+    print(f"{'phase':<10}{'median s':>10}{'max s':>9}   ({RUNS} fresh interpreters)")
+    for phase in ("import", "lifespan", "models"):
+        values = [s[phase] for s in samples]
+        print(f"{phase:<10}{statistics.median(values):>10.3f}{max(values):>9.3f}")
+    print("provider SDKs loaded by `import main`:", samples[0]["heavy"] or "none")
+
+if __name__ == "__main__":
+    main()
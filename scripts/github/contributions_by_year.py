@@ -1,14 +1,39 @@
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
-from datetime import datetime
-import requests
+from datetime import datetime, timezone
+from typing import Optional
+import asyncio
+import httpx
 import os
+import time
 from dotenv import load_dotenv
 
 load_dotenv()
 GIT_TOKEN = os.getenv("GIT_TOKEN")
 AGENT_LINK = os.getenv("AGENT_LINK")
-
-app = FastAPI()
+CURRENT_YEAR_TTL = float(os.getenv("CURRENT_YEAR_TTL", "300"))  # seconds the current year's total is served fresh
+CURRENT_YEAR_STALE = float(os.getenv("CURRENT_YEAR_STALE", "86400"))  # after that, served stale while refreshing
+CACHE_SIZE = int(os.getenv("CONTRIBUTIONS_CACHE_SIZE", "1024"))  # (username, year) entries kept
+DEFAULT_YEARS = [2024]  # always reported, alongside the current year, when no range is asked for
+FIRST_YEAR = 2008  # GitHub launched in 2008, nothing to count before that
+MAX_YEARS = 20  # years per request, all fetched in one GraphQL query
+
+client = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """One pooled, keep-alive client for every GitHub call."""
+    global client
+    client = httpx.AsyncClient(
+        headers={"Authorization": f"bearer {GIT_TOKEN}", "Content-Type": "application/json"},
+        limits=httpx.Limits(max_connections=10, max_keepalive_connections=10),
+        timeout=10,
+    )
+    yield
+    await client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 from fastapi.middleware.cors import CORSMiddleware
 app.add_middleware(
@@ -21,37 +46,27 @@ app.add_middleware(
 
 GITHUB_GRAPHQL_URL = "https://api.github.com/graphql"
 
-QUERY_TEMPLATE = """
-query ($username: String!, $from: DateTime, $to: DateTime) {
-  user(login: $username) {
-    contributionsCollection(from: $from, to: $to) {
-      contributionCalendar {
-        totalContributions
-      }
-    }
-  }
-}
+def build_query(years: list[int]):
+    """One aliased contributionsCollection per year, so any range costs a single round trip."""
+    fields = "\n".join(
+        f'    y{year}: contributionsCollection(from: "{year}-01-01T00:00:00Z", to: "{year}-12-31T23:59:59Z") '
+        "{ contributionCalendar { totalContributions } }"
+        for year in years
+    )
+    return f"""
+query ($username: String!) {{
+  user(login: $username) {{
+{fields}
+  }}
+}}
 """
 
-def fetch_contributions_for_year(username: str, year: int):
-    from_date = f"{year}-01-01T00:00:00Z"
-    to_date = f"{year}-12-31T23:59:59Z"
-
-    headers = {
-        "Authorization": f"bearer {GIT_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    payload = {
-        "query": QUERY_TEMPLATE,
-        "variables": {
-            "username": username,
-            "from": from_date,
-            "to": to_date,
-        },
-    }
-
-    response = requests.post(GITHUB_GRAPHQL_URL, json=payload, headers=headers)
+async def fetch_contributions(username: str, years: list[int]):
+    payload = {"query": build_query(years), "variables": {"username": username}}
+    try:
+        response = await client.post(GITHUB_GRAPHQL_URL, json=payload)
+    except httpx.HTTPError:
+        raise HTTPException(status_code=500, detail="Failed to fetch data from GitHub API")
 
     if response.status_code != 200:
         raise HTTPException(status_code=500, detail="Failed to fetch data from GitHub API")
@@ -60,19 +75,91 @@ def fetch_contributions_for_year(username: str, year: int):
 
     if "errors" in data:
         raise HTTPException(status_code=400, detail=data["errors"])
-
-    return data["data"]["user"]["contributionsCollection"]["contributionCalendar"]["totalContributions"]
+    if data["data"]["user"] is None:
+        raise HTTPException(status_code=404, detail=f"GitHub user not found: {username}")
+
+    user = data["data"]["user"]
+    return {year: user[f"y{year}"]["contributionCalendar"]["totalContributions"] for year in years}
+
+#? Cache
+# (username, year) -> (fetched_at, total), least recently used first. A year fetched after it ended is final and never
+# expires; the current year is fresh for CURRENT_YEAR_TTL, then served stale for up to CURRENT_YEAR_STALE while refreshing.
+cache = OrderedDict()
+inflight = {}  # (username, years) -> fetch task, shared by concurrent requests and background refreshes
+
+def year_end(year: int):
+    return datetime(year + 1, 1, 1, tzinfo=timezone.utc).timestamp()
+
+def cache_state(username: str, year: int, now: float):
+    """"fresh", "stale" or "missing" for one cached year."""
+    entry = cache.get((username, year))
+    if entry is None:
+        return "missing"
+    age = now - entry[0]
+    if entry[0] >= year_end(year) or age < CURRENT_YEAR_TTL:
+        return "fresh"
+    return "stale" if age < CURRENT_YEAR_TTL + CURRENT_YEAR_STALE else "missing"
+
+def store(username: str, totals: dict, fetched_at: float):
+    for year, total in totals.items():
+        cache[(username, year)] = (fetched_at, total)
+        cache.move_to_end((username, year))
+    while len(cache) > CACHE_SIZE:
+        cache.popitem(last=False)
+
+async def fetch_and_store(username: str, years: list[int]):
+    totals = await fetch_contributions(username, years)
+    store(username, totals, time.time())
+    return totals
+
+def fetch_shared(username: str, years: list[int]):
+    key = (username, tuple(years))
+    task = inflight.get(key)
+    if task is None:
+        task = inflight[key] = asyncio.create_task(fetch_and_store(username, years))
+        task.add_done_callback(lambda _: inflight.pop(key, None))
+    return task
+
+def log_refresh_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        print("❌ Contributions refresh error: ", task.exception())
+
+async def get_totals(username: str, years: list[int]):
+    now = time.time()
+    states = {year: cache_state(username, year, now) for year in years}
+
+    # Read (and mark as recently used) before awaiting, so evictions during the fetch can't lose them
+    totals = {}
+    for year, state in states.items():
+        if state != "missing":
+            cache.move_to_end((username, year))
+            totals[year] = cache[(username, year)][1]
+
+    stale = [year for year, state in states.items() if state == "stale"]
+    if stale:
+        fetch_shared(username, stale).add_done_callback(log_refresh_error)
+
+    missing = [year for year, state in states.items() if state == "missing"]
+    if missing:
+        totals.update(await asyncio.shield(fetch_shared(username, missing)))
+
+    return {year: totals[year] for year in years}
 
 @app.get("/contributions/{username}")
-def get_contributions(username: str):
-    current_year = datetime.utcnow().year
-    years = [2024, current_year] if current_year != 2024 else [2024]
-
-    contributions_by_year = {}
-
-    for year in years:
-        total = fetch_contributions_for_year(username, year)
-        contributions_by_year[year] = total
+async def get_contributions(username: str, from_year: Optional[int] = None, to_year: Optional[int] = None):
+    current_year = datetime.now(timezone.utc).year
+    if from_year is None and to_year is None:
+        years = sorted({*DEFAULT_YEARS, current_year})
+    else:
+        from_year = DEFAULT_YEARS[0] if from_year is None else from_year
+        to_year = current_year if to_year is None else to_year
+        if not FIRST_YEAR <= from_year <= to_year <= current_year:
+            raise HTTPException(status_code=400, detail=f"Years must satisfy {FIRST_YEAR} <= from_year <= to_year <= {current_year}")
+        if to_year - from_year + 1 > MAX_YEARS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_YEARS} years per request")
+        years = list(range(from_year, to_year + 1))
+
+    contributions_by_year = await get_totals(username.lower(), years)
 
     return {
         "username": username,
@@ -0,0 +1,33 @@
+import glob
+import os
+import sys
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from config import EMBEDDING_MODEL, EMBEDDINGS_BACKEND, LOCAL_INDEX_PATH
+from retrievers import build_local_index, chunk_document, StubEmbeddings
+
+# Precompute the lore embeddings for RETRIEVER_BACKEND=local.
+# Run with the same EMBEDDINGS_BACKEND the server will use (e.g. "stub" for offline runs).
+stellarbloom = os.path.join(ROOT, "data", "stellarbloom")
+FILE_PATHS = sorted(glob.glob(f"{stellarbloom}/*.txt"))
+
+if EMBEDDINGS_BACKEND == "stub":
+    embeddings = StubEmbeddings()
+else:
+    from langchain_openai import OpenAIEmbeddings
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+records = []
+for file_path in FILE_PATHS:
+    with open(file_path, "r", encoding="utf-8") as file:
+        source = os.path.splitext(os.path.basename(file_path))[0]
+        records.extend(chunk_document(file.read(), source))
+        print(f"Added: {file_path}")
+
+build_local_index(LOCAL_INDEX_PATH, records, embeddings)
+print(f"Saved {len(records)} chunks to {LOCAL_INDEX_PATH}.npy")
@@ -1,17 +1,35 @@
+import glob
+import json
 import os
+import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
 from pinecone import Pinecone, ServerlessSpec
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 
 load_dotenv()
 
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from config import EMBEDDING_MODEL
+from retrievers import chunk_document
+
+# Incremental ingestion: chunks get content-hash ids, so a re-run only embeds and upserts chunks whose text
+# changed and deletes chunks that disappeared. The manifest records what is already in the index.
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "400"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "60"))
+EMBED_BATCH_SIZE = 64
+EMBED_WORKERS = 4
+UPSERT_BATCH_SIZE = 100
+
 pinecone_api_key = os.environ["PINECONE_API_KEY"]
 pc = Pinecone(api_key=pinecone_api_key)
 
 index_name = "stellarbloom"
+MANIFEST_PATH = os.path.join(os.path.dirname(__file__), f"manifest_{index_name}.json")
 
 existing_indexes = [index_info["name"] for index_info in pc.list_indexes()]
 print("Existing Indexes: ", existing_indexes)
@@ -35,39 +53,73 @@ if index_name not in existing_indexes:
 
 # Connect to the index
 index = pc.Index(index_name)
-stellarbloom = "C:/Users/ethan/Documents/Work/Stellar Bloom Academy/bot/data/stellarbloom"
-overview_proj = ["celestial_guides", "origin", "philosophy_of_light", "starbourne_journey", "the_bloom_rite"]
-# main_portfolio = "C:/Users/ethan/Documents/General/Portfolio-Bot/data/"
-
-FILE_PATHS = [
-    f"{stellarbloom}/{proj}.txt" for proj in overview_proj
-]
+stellarbloom = os.path.join(ROOT, "data", "stellarbloom")
+FILE_PATHS = sorted(glob.glob(f"{stellarbloom}/*.txt"))
 
 print("File Paths: ", FILE_PATHS[:3])
 
-# Initialize Embeddings
-model_name = "sentence-transformers/all-mpnet-base-v2"
-model_kwargs = {'device': 'cpu'}
-encode_kwargs = {'normalize_embeddings': False}
-embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
+def batched(items: list, size: int):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def load_manifest() -> dict:
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as file:
+        return json.load(file)
 
-# Create or Use Existing Index
-vector_store = PineconeVectorStore(index_name=index_name, embedding=embeddings)
+def save_manifest(chunks: dict):
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as file:
+        json.dump(chunks, file, indent=2, sort_keys=True)
 
-from langchain_core.documents import Document
-from uuid import uuid4
-documents = []
+def already_indexed(ids: list[str]) -> set:
+    """Ids that exist in the index but are missing from the manifest (e.g. the manifest was lost)."""
+    found = set()
+    for batch in batched(ids, UPSERT_BATCH_SIZE):
+        found.update(index.fetch(ids=batch).vectors.keys())
+    return found
 
-# Add Files to Pinecone
+# Chunk every file
+records = {}
 for file_path in FILE_PATHS:
-    with open(file_path, "r") as file:
-        text = file.read()
-        document = Document(
-            page_content=text,
-            # metadata={"source": "tweet"}
-            )
-        documents.append(document)
-        print(f"Added: {file_path}")
-
-uuids = [str(uuid4()) for _ in range(len(documents))]
-vector_store.add_documents(documents=documents, ids=uuids)
\ No newline at end of file
+    with open(file_path, "r", encoding="utf-8") as file:
+        source = os.path.splitext(os.path.basename(file_path))[0]
+        for record in chunk_document(file.read(), source, CHUNK_TOKENS, CHUNK_OVERLAP):
+            records[record["id"]] = record
+
+manifest = load_manifest()
+to_delete = sorted(set(manifest) - set(records))
+to_add = sorted(set(records) - set(manifest))
+if to_add:
+    recovered = already_indexed(to_add)
+    manifest.update({id: records[id]["metadata"] for id in recovered})
+    to_add = [id for id in to_add if id not in recovered]
+print(f"Chunks: {len(records)} total, {len(to_add)} to embed, {len(to_delete)} to delete")
+
+# Embed new chunks in parallel batches and upsert them
+if to_add:
+    embeddings = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    batches = batched(to_add, EMBED_BATCH_SIZE)
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+        vectors = executor.map(lambda ids: embeddings.embed_documents([records[id]["text"] for id in ids]), batches)
+        for ids, batch_vectors in zip(batches, vectors):
+            upserts = [
+                # "text" is the metadata key PineconeVectorStore reads page_content from
+                (id, vector, {**records[id]["metadata"], "text": records[id]["text"]})
+                for id, vector in zip(ids, batch_vectors)
+            ]
+            for upsert_batch in batched(upserts, UPSERT_BATCH_SIZE):
+                index.upsert(vectors=upsert_batch)
+            manifest.update({id: records[id]["metadata"] for id in ids})
+            save_manifest(manifest)
+            print(f"Upserted {len(ids)} chunks")
+
+# Drop chunks that no longer exist in the source files
+for batch in batched(to_delete, UPSERT_BATCH_SIZE):
+    index.delete(ids=batch)
+    for id in batch:
+        manifest.pop(id, None)
+    save_manifest(manifest)
+    print(f"Deleted {len(batch)} chunks")
+
+save_manifest(manifest)
+print("Index up to date.")
@@ -0,0 +1,15 @@
+from config import GRACEFUL_SHUTDOWN_TIMEOUT, HOST, PORT, WEB_CONCURRENCY
+
+import uvicorn
+
+# Production entry point. With WEB_CONCURRENCY > 1 uvicorn supervises that many worker processes; each one runs
+# the app lifespan itself, so the graph, Postgres pool (DB_POOL_BUDGET split between them) and model clients are
+# per worker and nothing is shared. On SIGTERM workers stop accepting, let in-flight turns finish, then shut down.
+if __name__ == "__main__":
+    uvicorn.run(
+        "src.main:app",
+        host=HOST,
+        port=PORT,
+        workers=WEB_CONCURRENCY,
+        timeout_graceful_shutdown=GRACEFUL_SHUTDOWN_TIMEOUT,
+    )
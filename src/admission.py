@@ -0,0 +1,161 @@
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import asyncio
+
+#? Global admission control
+class Overloaded(Exception):
+    """Raised instead of queueing a turn indefinitely; the endpoint turns it into a 429/503 with Retry-After."""
+    def __init__(self, status_code: int, detail: str, retry_after: int = 1):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class AdmissionLimiter:
+    """Caps graph runs in flight. Past `max_active`, up to `max_queued` turns wait at most `queue_timeout` seconds
+    for a slot (503 after that); beyond the queue new turns are refused straight away (429). max_active=0 disables it."""
+    def __init__(self, max_active: int, max_queued: int, queue_timeout: float):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max(max_active, 1))
+        self.active = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def check(self):
+        """Refuse up front when every slot is busy and the queue is full."""
+        if self.max_active > 0 and self.active >= self.max_active and self.waiting >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded(429, "Too many chats in progress, try again shortly.")
+
+    @asynccontextmanager
+    async def admit(self):
+        if not self.max_active:
+            yield
+            return
+        self.check()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(503, "Server busy, try again shortly.")
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self):
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_active": self.max_active,
+            "max_queued": self.max_queued,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+#? Per thread turn ordering
+MERGED = object()  # result for a message that was folded into another request's turn
+
+class ThreadTurnQueue:
+    """Runs one turn at a time per thread, in arrival order, so two requests never race on the same checkpoint.
+    With a merge window, messages that queue up behind a turn (or arrive within `merge_window` seconds of it
+    starting) are joined into a single turn; the request that runs it gets the reply, the others get MERGED.
+    At most `max_waiting` requests queue behind a thread's running turn (429 beyond that, 0 = no cap), and each
+    waits at most `timeout` seconds for its turn (503 after that, None = no limit)."""
+    def __init__(self, merge_window: float = 0, max_waiting: int = 0, timeout: Optional[float] = None):
+        self.merge_window = merge_window
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self._threads = {}  # thread_id -> {"lock", "users", "pending"}
+        self.merged = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _enter(self, thread_id: str):
+        state = self._threads.setdefault(thread_id, {"lock": asyncio.Lock(), "users": 0, "pending": []})
+        if self.max_waiting and state["users"] > self.max_waiting:  # the running turn plus max_waiting queued
+            self.rejected += 1
+            raise Overloaded(429, "Too many messages waiting in this chat, slow down.")
+        state["users"] += 1
+        return state
+
+    async def _acquire(self, state: dict):
+        try:
+            await asyncio.wait_for(state["lock"].acquire(), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded(503, "Still answering your previous message, try again shortly.")
+
+    def _leave(self, thread_id: str):
+        state = self._threads[thread_id]
+        state["users"] -= 1
+        if not state["users"]:
+            del self._threads[thread_id]
+
+    @asynccontextmanager
+    async def serialize(self, thread_id: str):
+        state = self._enter(thread_id)
+        try:
+            await self._acquire(state)
+            try:
+                yield
+            finally:
+                state["lock"].release()
+        finally:
+            self._leave(thread_id)
+
+    async def submit(self, thread_id: str, message: str, run):
+        """Await `run(message)` in turn order; `message` may be merged with others queued for the thread."""
+        if self.merge_window <= 0:
+            async with self.serialize(thread_id):
+                return await run(message)
+
+        entry = {"message": message, "future": asyncio.get_running_loop().create_future()}
+        state = self._enter(thread_id)
+        state["pending"].append(entry)  # visible to the turn ahead of us while we wait
+        try:
+            try:
+                await self._acquire(state)
+            except Overloaded:
+                if entry in state["pending"]:
+                    state["pending"].remove(entry)
+                    raise
+                return await entry["future"]  # already folded into the turn that is running
+
+            try:
+                if entry["future"].done():
+                    return entry["future"].result()
+                await asyncio.sleep(self.merge_window)  # let rapid-fire follow ups join this turn
+                batch, state["pending"] = state["pending"], []
+                followers = [e for e in batch if e is not entry]
+                try:
+                    result = await run("\n".join(e["message"] for e in batch))
+                except BaseException as e:
+                    for follower in followers:
+                        follower["future"].set_exception(e if isinstance(e, Exception) else RuntimeError("Turn cancelled"))
+                    raise
+                self.merged += len(followers)
+                for follower in followers:
+                    follower["future"].set_result(MERGED)
+                return result
+            finally:
+                state["lock"].release()
+        finally:
+            self._leave(thread_id)
+
+    def stats(self):
+        return {
+            "threads": len(self._threads),
+            "merged": self.merged,
+            "thread_rejected": self.rejected,
+            "thread_timed_out": self.timed_out,
+        }
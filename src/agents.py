@@ -2,16 +2,21 @@ from dotenv import load_dotenv
 from typing import Annotated
 
 from langchain_core.messages import SystemMessage
+from langchain_core.messages.utils import count_tokens_approximately
 from langchain_core.tools import tool, InjectedToolArg
-from langchain_deepseek import ChatDeepSeek
-from langchain_openai import ChatOpenAI
 
 from langgraph.types import Command, interrupt
 
-from config import GPT_TYPE
+from config import (
+    GPT_TYPE, PROVIDER_RATE_LIMITS, MODEL_RATE_LIMITS, RATE_LIMIT_MAX_WAIT, MODEL_MAX_RETRIES, UNHEDGED_RETRIES,
+    BREAKER_FAILURES, BREAKER_RESET, WEB_CONCURRENCY,
+)
 from helper import create_prompt, ValidateLore, Identify
+from instrumentation import log_event
+from ratelimit import ProviderGuard
+from singleflight import SingleFlight
 
-import os
+import logging, os, threading
 
 load_dotenv()
 
@@ -31,47 +36,127 @@ async def get_lore() -> str:
 
 tools = [get_lore]
 
-gpt_chatbot = ChatOpenAI(
-    model=GPT_TYPE,
-    temperature=0.9,
-    max_tokens=None,
-    timeout=20,
-    max_retries=2,
-    api_key=OPENAI_API_KEY,
-).bind_tools(tools)
-
-ds_chatbot = ChatDeepSeek(
-    model="deepseek-chat",
-    temperature=0.9,
-    max_tokens=None,
-    timeout=30,
-    max_retries=1,
-    api_key=DEEPSEEK_API_KEY,
-).bind_tools(tools)
-
-gpt_lorebot = ChatOpenAI(
-    model=GPT_TYPE,
-    temperature=0,
-    max_tokens=250,
-    timeout=20,
-    max_retries=2,
-    api_key=OPENAI_API_KEY,
-).with_structured_output(ValidateLore, method="function_calling")
-
-splitter = ChatOpenAI(
-    model=GPT_TYPE,
-    temperature=0.1,
-    max_tokens=5000,
-    timeout=20,
-    max_retries=2,
-    api_key=OPENAI_API_KEY,
+#? Model registry
+# Every client call goes through one guard: request/token budgets per provider and per model, queued in arrival
+# order whichever endpoint made the call, and a circuit breaker per provider that fails fast while it is down
+guard = ProviderGuard(
+    PROVIDER_RATE_LIMITS, MODEL_RATE_LIMITS, RATE_LIMIT_MAX_WAIT, BREAKER_FAILURES, BREAKER_RESET, share=WEB_CONCURRENCY
 )
+EXPECTED_COMPLETION_TOKENS = 300  # charged up front with the prompt, settled against usage_metadata afterwards
+
+# name -> client settings. "tools" binds the tools above, "schema" wraps the client for structured output.
+# stream_usage: streamed calls (/chat/stream) report usage_metadata too, for token metrics and the TPM budget
+MODEL_SPECS = {
+    "gpt_chatbot": {
+        "provider": "openai", "model": GPT_TYPE, "temperature": 0.9, "max_tokens": None, "timeout": 20,
+        "max_retries": MODEL_MAX_RETRIES, "stream_usage": True, "tools": tools,
+    },
+    "ds_chatbot": {
+        "provider": "deepseek", "model": "deepseek-chat", "temperature": 0.9, "max_tokens": None, "timeout": 30,
+        "max_retries": MODEL_MAX_RETRIES, "stream_usage": True, "tools": tools,
+    },
+    "gpt_lorebot": {
+        "provider": "openai", "model": GPT_TYPE, "temperature": 0, "max_tokens": 250, "timeout": 20,
+        "max_retries": MODEL_MAX_RETRIES, "retries": UNHEDGED_RETRIES, "stream_usage": True, "schema": ValidateLore,
+    },
+    "splitter": {
+        "provider": "openai", "model": GPT_TYPE, "temperature": 0.1, "max_tokens": 5000, "timeout": 20,
+        "max_retries": MODEL_MAX_RETRIES, "retries": UNHEDGED_RETRIES, "stream_usage": True,
+    },
+    "identity_validator": {
+        "provider": "openai", "model": "gpt-4o-mini", "temperature": 0, "max_tokens": 250, "timeout": 20,
+        "max_retries": MODEL_MAX_RETRIES, "retries": UNHEDGED_RETRIES, "stream_usage": True, "schema": Identify,
+    },
+    "summarizer": {
+        "provider": "openai", "model": "gpt-4o-mini", "temperature": 0, "max_tokens": 300, "timeout": 20,
+        "max_retries": MODEL_MAX_RETRIES, "retries": UNHEDGED_RETRIES, "stream_usage": True,
+    },
+}
+
+class ModelRegistry:
+    """Builds each client from MODEL_SPECS on first use. The provider SDKs (langchain_openai pulls in openai,
+    langchain_deepseek pulls in both) are only imported then, which keeps them off the import path of the app."""
+    def __init__(self, specs: dict):
+        self.specs = specs
+        self._models = {}
+        self._lock = threading.Lock()  # warm_up builds from a worker thread while requests may ask for a client
+
+    def get(self, name: str):
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                model = self._models.get(name)
+                if model is None:
+                    model = self._models[name] = self._build(self.specs[name])
+        return model
+
+    def _build(self, spec: dict):
+        spec = dict(spec)
+        provider, bound_tools, schema = spec.pop("provider"), spec.pop("tools", None), spec.pop("schema", None)
+        spec.pop("retries", None)
+        if provider == "openai":
+            from langchain_openai import ChatOpenAI
+
+            model = ChatOpenAI(api_key=OPENAI_API_KEY, **spec)
+        elif provider == "deepseek":
+            from langchain_deepseek import ChatDeepSeek
+
+            model = ChatDeepSeek(api_key=DEEPSEEK_API_KEY, **spec)
+        else:
+            raise ValueError(f"Unknown model provider: {provider}")
+
+        if bound_tools:
+            model = model.bind_tools(bound_tools)
+        if schema is not None:
+            model = model.with_structured_output(schema, method="function_calling")
+        return model
+
+    async def call(self, name: str, input, *args, **kwargs):
+        spec = self.specs[name]
+        tokens = count_tokens_approximately(input) + min(spec["max_tokens"] or EXPECTED_COMPLETION_TOKENS, EXPECTED_COMPLETION_TOKENS)
+        return await guard.call(
+            spec["provider"], spec["model"], tokens, lambda: self.get(name).ainvoke(input, *args, **kwargs),
+            retries=spec.get("retries", 0),
+        )
+
+    def warm_up(self):
+        """Build every client; run from lifespan in a worker thread so the first request doesn't pay for it."""
+        for name in self.specs:
+            try:
+                self.get(name)
+            except Exception as e:
+                log_event("model_warm_up_error", logging.WARNING, model=name, error=str(e))
+
+    def lazy(self, name: str):
+        return LazyModel(self, name)
+
+class LazyModel:
+    """Stands in for a client at import time; the first attribute access builds it through the registry."""
+    def __init__(self, registry: ModelRegistry, name: str):
+        self._registry = registry
+        self._name = name
+
+    async def ainvoke(self, input, *args, **kwargs):
+        return await self._registry.call(self._name, input, *args, **kwargs)
+
+    def __getattr__(self, attr):
+        # Graph compilation probes nodes for private/dunder attributes, which must not trigger a build
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self._registry.get(self._name), attr)
+
+models = ModelRegistry(MODEL_SPECS)
+
+gpt_chatbot = models.lazy("gpt_chatbot")
+ds_chatbot = models.lazy("ds_chatbot")
+gpt_lorebot = models.lazy("gpt_lorebot")
+
+# Identical in-flight validator prompts share one model call
+lore_flight = SingleFlight("lore_validator")
+
+splitter = models.lazy("splitter")
+identity_validator = models.lazy("identity_validator")
+
+identity_flight = SingleFlight("identity_validator")
 
-identity_validator = ChatOpenAI(
-    model="gpt-4o-mini",
-    temperature=0,
-    max_tokens=250,
-    timeout=20,
-    max_retries=2,
-    api_key=OPENAI_API_KEY,
-).with_structured_output(Identify, method="function_calling")
+summarizer = models.lazy("summarizer")
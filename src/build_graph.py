@@ -1,118 +1,197 @@
 from copy import deepcopy
 from typing_extensions import Literal
 
-from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import Command, interrupt
+from langgraph.types import interrupt
 
-from agents import ds_chatbot, gpt_chatbot, gpt_lorebot, splitter, get_lore
-from helper import create_prompt, State, VectorStoreManager
+from agents import ds_chatbot, gpt_chatbot, gpt_lorebot, lore_flight, splitter, summarizer, tools
+from config import (
+    CHAT_TIMEOUT, HEDGE_DEFAULT_DELAY, HEDGE_PERCENTILE, HISTORY_SUMMARY, HISTORY_SUMMARY_TRIGGER, LORE_DROP_THRESHOLD,
+    LORE_INJECT_THRESHOLD, SPLITTER_MODE, TOOL_TIMEOUT,
+)
+from helper import (
+    build_chat_messages, create_prompt, get_vector_store, sample_split_count, split_history, split_message, trim_history, State,
+)
+from cache import normalize_query
+from instrumentation import current_turn, log_event, observe_chat, timed_llm, timed_node, RETRIEVAL_SECONDS
+from scheduler import HedgedScheduler
+from singleflight import SingleFlight
 
-import asyncio
+import asyncio, logging, time
 
 graph_builder = StateGraph(State)
 
+# Node whose message is the user facing reply for this turn
+FINAL_NODE = "chatbot" if SPLITTER_MODE == "local" else "splitter"
+
+# DeepSeek first, GPT hedged in once DeepSeek runs past its own p90
+chat_scheduler = HedgedScheduler(
+    {
+        "deepseek": timed_llm("deepseek", ds_chatbot.ainvoke, chat=True),
+        "openai": timed_llm("openai", gpt_chatbot.ainvoke, chat=True),
+    },
+    hedge_percentile=HEDGE_PERCENTILE,
+    default_hedge_delay=HEDGE_DEFAULT_DELAY,
+    timeout=CHAT_TIMEOUT,
+)
+retrieval_flight = SingleFlight("retrieval")
+
 
 #* Agent Nodes
 async def chatbot(state: State):
-    async def get_deepseek_response():
-        return await ds_chatbot.ainvoke(state["messages"])
-
-    async def get_gpt_response():
-        await asyncio.sleep(9)
-        return await gpt_chatbot.ainvoke(state["messages"])
-    
     try:
-        # Create tasks for each coroutine
-        ds_task = asyncio.create_task(get_deepseek_response())
-        gpt_task = asyncio.create_task(get_gpt_response())
-        done, pending = await asyncio.wait([ds_task, gpt_task], return_when=asyncio.FIRST_COMPLETED, timeout=30)
+        response, provider = await observe_chat(chat_scheduler.run, build_chat_messages(state))
+        response.response_metadata["provider"] = provider
+    except Exception as e:
+        log_event("chatbot_error", logging.WARNING, error=str(e))
+        response = AIMessage(content="gtg, ttyl.")
 
-        for task in done: 
-            response = task.result(); break
-        for task in pending: task.cancel()
+    if not response.content: response.content = "gtg, ttyl."
 
-    except asyncio.TimeoutError:
-        response.content = "gtg, ttyl."
+    if response.tool_calls:
+        return {"messages": [response]}
 
-    if not response.content: response.content = "gtg, ttyl."
-    
-    assert len(response.tool_calls) <= 1
+    if SPLITTER_MODE == "local":
+        response.content = split_message(response.content, sample_split_count())
+
+    # Lore only serves the turn it was fetched for
+    return {"messages": [response], "lore": ""}
 
-    return {"messages": [response]}
+def lore_decision(results: list) -> str:
+    """Route on the best retrieval score: "inject" when it clears LORE_INJECT_THRESHOLD, "drop" below
+    LORE_DROP_THRESHOLD, and "validate" (ask gpt_lorebot) only for the ambiguous band in between."""
+    top_score = results[0][1] if results else 0.0
+    if top_score >= LORE_INJECT_THRESHOLD:
+        return "inject"
+    if top_score < LORE_DROP_THRESHOLD:
+        return "drop"
+    return "validate"
 
 async def lorebot(state: State):
     try:
-        last_message = state["messages"][-1]
-        print("Last Message: ", last_message)
-        pinecone_vs = VectorStoreManager()
-        retrieved_docs = pinecone_vs.retrieve_from_vector_store(last_message, 3)
-        retrieved_context = "\n".join([res.page_content for res in retrieved_docs])
-        result = await gpt_lorebot.ainvoke([SystemMessage(create_prompt(info=[last_message, retrieved_context], llm_type="lore_validator"))])
-        print("rag validator result: ", result)
-        if result.is_neccessary:
-            return Command(
-                goto="chatbot",
-                update={"messages": retrieved_context},
-            )
-        else:
-            return "chatbot"
+        last_message = next(m.content for m in reversed(state["messages"]) if isinstance(m, HumanMessage))
+        start = time.perf_counter()
+        results = await retrieval_flight.do((normalize_query(last_message), 3), get_vector_store().aretrieve, last_message, 3)
+        elapsed, stats = time.perf_counter() - start, current_turn()
+        RETRIEVAL_SECONDS.observe(elapsed)
+        if stats is not None:
+            stats.retrieval_seconds += elapsed
+        decision = lore_decision(results)
+        log_event("lore", logging.DEBUG, decision=decision, top_score=results[0][1] if results else None)
+        if decision == "drop":
+            return {}
+
+        retrieved_context = "\n".join([doc.page_content for doc, score in results if score >= LORE_DROP_THRESHOLD])
+        if decision == "validate":
+            prompt = create_prompt(info=[last_message, retrieved_context], llm_type="lore_validator")
+            result = await lore_flight.do(prompt, timed_llm("lore_validator", gpt_lorebot.ainvoke), [SystemMessage(prompt)])
+            log_event("lore_validator", logging.DEBUG, is_necessary=result.is_necessary)
+            if not result.is_necessary:
+                return {}
+        return {"lore": retrieved_context}
     except Exception as e:
-        print("❌RAG error: ", e)
+        log_event("rag_error", logging.WARNING, error=str(e))
+        return {}
 
 async def splitter_bot(state: State):
     last_message = state["messages"][-1]
-    message = await splitter.ainvoke([SystemMessage(create_prompt(info=[last_message], llm_type="splitter"))])
+    try:
+        message = await timed_llm("splitter", splitter.ainvoke)([SystemMessage(create_prompt(info=[last_message], llm_type="splitter"))])
+    except Exception as e:
+        # Splitting is cosmetic: send the reply as one message rather than failing the turn
+        log_event("splitter_error", logging.WARNING, error=str(e))
+        message = AIMessage(content=split_message(last_message.content, sample_split_count()))
 
     return {"messages": [message]}
 
+def needs_compaction(state: State):
+    return count_tokens_approximately(split_history(state["messages"])[1]) > HISTORY_SUMMARY_TRIGGER
+
+async def compact_history(state: State):
+    """Roll turns that no longer fit the prompt budget into the running summary and drop them from the checkpoint.
+    Not on the reply path: main runs it after the turn and applies the result with aupdate_state(as_node="compact")."""
+    persona, history = split_history(state["messages"])
+    if not needs_compaction(state):
+        return {}
+    try:
+        older = history[:len(history) - len(trim_history(history))]
+        persona_ids = {m.id for m in persona}
+        stale_prompts = [m for m in state["messages"] if isinstance(m, SystemMessage) and m.id not in persona_ids]
+        if not older:
+            return {"messages": [RemoveMessage(id=m.id) for m in stale_prompts]}
+        transcript = " ".join(f"{m.type}: {m.content}" for m in older if isinstance(m.content, str) and m.content)
+        summary = await timed_llm("summarizer", summarizer.ainvoke)([SystemMessage(create_prompt(info=[state.get("summary", ""), transcript], llm_type="summarizer"))])
+        return {
+            "summary": summary.content,
+            "messages": [RemoveMessage(id=m.id) for m in older + stale_prompts],
+        }
+    except Exception as e:
+        log_event("compaction_error", logging.WARNING, error=str(e))
+        return {}
+
 #* Tool related nodes
-def route_after_llm(state) -> Literal["splitter", "tools"]:
+def route_after_llm(state) -> Literal["splitter", "tools", "__end__"]:
     tools = state["messages"][-1].tool_calls
     if len(tools) == 0:
-        return "splitter"
+        return END if SPLITTER_MODE == "local" else "splitter"
     return "tools"
     
+TOOLS = {tool.name: tool for tool in tools}
+
+async def run_tool(tool_call) -> ToolMessage:
+    """Run one tool call under TOOL_TIMEOUT; failures come back as an error ToolMessage the model can read."""
+    name = tool_call["name"]
+    try:
+        if name not in TOOLS:
+            raise ValueError(f"unknown tool {name}")
+        content, status = await asyncio.wait_for(TOOLS[name].ainvoke(tool_call["args"]), timeout=TOOL_TIMEOUT), "success"
+    except asyncio.TimeoutError:
+        log_event("tool_error", logging.WARNING, tool=name, error="timeout")
+        content, status = f"Error: {name} timed out after {TOOL_TIMEOUT}s", "error"
+    except Exception as e:
+        log_event("tool_error", logging.WARNING, tool=name, error=str(e))
+        content, status = f"Error: {e}", "error"
+    return ToolMessage(content=content, name=name, tool_call_id=tool_call["id"], status=status)
+
 async def tool_node(state):
-    new_messages = []
-    tools = tools = {"get_lore": get_lore}
+    # Independent calls run concurrently; gather keeps the results in tool call order
     tool_calls = state["messages"][-1].tool_calls
-    for tool_call in tool_calls:
-        tool = tools[tool_call["name"]]
-        result = await tool.ainvoke(tool_call["args"])
-        new_messages.append(
-            {
-                "role": "tool",
-                "name": tool_call["name"],
-                "content": result,
-                "tool_call_id": tool_call["id"],
-            }
-        )
-    return {"messages": new_messages}
+    new_messages = await asyncio.gather(*[run_tool(tool_call) for tool_call in tool_calls])
+    return {"messages": list(new_messages)}
 
 def route_after_tool(state) -> Literal["lore_rag", "chatbot"]:
-    last_message = state["messages"][-1]
-
-    if isinstance(last_message, ToolMessage) and last_message.name == "get_lore":
-        return "lore_rag"
+    # Every ToolMessage after the last AI message came from this tools step
+    for message in reversed(state["messages"]):
+        if not isinstance(message, ToolMessage):
+            break
+        if message.name == "get_lore" and message.status == "success":
+            return "lore_rag"
     
     return "chatbot"
 
-graph_builder.add_node("chatbot", chatbot)
-graph_builder.add_node("lore_rag", lorebot)
-graph_builder.add_node("splitter", splitter_bot)
-graph_builder.add_node("tools", tool_node)
+graph_builder.add_node("chatbot", timed_node("chatbot", chatbot))
+graph_builder.add_node("lore_rag", timed_node("lore_rag", lorebot))
+graph_builder.add_node("tools", timed_node("tools", tool_node))
 
 graph_builder.add_edge(START, "chatbot")
 graph_builder.add_edge("lore_rag", "chatbot")
 graph_builder.add_conditional_edges(
     "chatbot",
     route_after_llm,
+    ["tools", END if SPLITTER_MODE == "local" else "splitter"],
 )
 graph_builder.add_conditional_edges(
     "tools",
     route_after_tool,
 )
-graph_builder.add_edge("splitter", END)
+if SPLITTER_MODE == "llm":
+    graph_builder.add_node("splitter", timed_node("splitter", splitter_bot))
+    graph_builder.add_edge("splitter", END)
+if HISTORY_SUMMARY:
+    # Only entered through aupdate_state once a turn has replied, never from the edges above
+    graph_builder.add_node("compact", compact_history)
+    graph_builder.add_edge("compact", END)
     
\ No newline at end of file
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+
+import numpy as np
+import time
+
+#? Generic LRU + TTL cache
+class TTLCache:
+    """LRU cache bounded by size, where every entry also expires `ttl` seconds after it was set."""
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def peek(self, key, default=None):
+        """Like get, but without touching LRU order or the hit/miss counters."""
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return default
+        return entry[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def items(self):
+        """Live (key, value) pairs, dropping anything that has expired."""
+        now = time.monotonic()
+        for key in [k for k, (expires_at, _) in self._data.items() if expires_at < now]:
+            del self._data[key]
+        return [(key, value) for key, (_, value) in self._data.items()]
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+        }
+
+#? Semantic cache for retrieval
+def normalize_query(text: str) -> str:
+    """Casefold, collapse whitespace and drop trailing punctuation so trivially different questions share a key."""
+    return " ".join(text.casefold().split()).strip(" ?!.")
+
+class SemanticCache:
+    """Exact match on normalised query text, falling back to nearest neighbour over cached query embeddings."""
+    def __init__(self, max_size: int, ttl: float, threshold: float):
+        self.threshold = threshold
+        self._entries = TTLCache(max_size, ttl)  # normalised query -> (unit vector, value)
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get(self, query: str):
+        entry = self._entries.get(normalize_query(query))
+        if entry is None:
+            return None
+        self.exact_hits += 1
+        return entry[1]
+
+    def get_similar(self, vector):
+        """Return the value of the closest cached query if its cosine similarity clears the threshold."""
+        entries = self._entries.items()
+        if entries:
+            matrix = np.stack([vec for _, (vec, _) in entries])
+            scores = matrix @ self._unit(vector)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                key, (_, value) = entries[best]
+                self._entries.get(key)  # refresh LRU position
+                self.semantic_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    def set(self, query: str, vector, value):
+        self._entries.set(normalize_query(query), (self._unit(vector), value))
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        total = self.exact_hits + self.semantic_hits + self.misses
+        hits = self.exact_hits + self.semantic_hits
+        return {
+            "size": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
@@ -0,0 +1,258 @@
+from contextlib import asynccontextmanager
+from copy import deepcopy
+from typing import Any, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver, ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple, get_checkpoint_metadata,
+    WRITES_IDX_MAP,
+)
+
+from cache import TTLCache
+from instrumentation import CHECKPOINT_SECONDS, current_turn
+
+import asyncio, time
+
+#? Wrapped savers
+class DelegatingCheckpointSaver(BaseCheckpointSaver):
+    """Passes everything through to `saver`; the wrappers below override only the calls they change."""
+    def __init__(self, saver: BaseCheckpointSaver):
+        super().__init__(serde=saver.serde)
+        self.saver = saver
+
+    @property
+    def config_specs(self):
+        return self.saver.config_specs
+
+    def get_next_version(self, current, channel):
+        return self.saver.get_next_version(current, channel)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self.saver.aget_tuple(config)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        async for item in self.saver.alist(config, filter=filter, before=before, limit=limit):
+            yield item
+
+#? Turn level checkpoint coalescing
+class BufferedCheckpointSaver(DelegatingCheckpointSaver):
+    """Wraps a saver so that, inside `turn(thread_id)`, every intermediate checkpoint stays in memory and only
+    the last one (with its pending writes) is persisted when the turn ends. Reads inside the turn see the buffer.
+    Outside a turn (e.g. aupdate_state) calls go straight through to the wrapped saver."""
+    def __init__(self, saver: BaseCheckpointSaver):
+        super().__init__(saver)
+        self._active = {}  # thread_id -> number of open turns
+        self._buffers = {}  # (thread_id, checkpoint_ns) -> buffered state for the turn
+
+    def _buffer_for(self, config: RunnableConfig):
+        configurable = config["configurable"]
+        return self._buffers.get((configurable["thread_id"], configurable.get("checkpoint_ns", "")))
+
+    @asynccontextmanager
+    async def turn(self, thread_id: str):
+        self._active[thread_id] = self._active.get(thread_id, 0) + 1
+        try:
+            yield
+        finally:
+            self._active[thread_id] -= 1
+            if not self._active[thread_id]:
+                del self._active[thread_id]
+                # Shielded so a client disconnect can't drop the turn's state
+                await asyncio.shield(self.flush(thread_id))
+
+    async def flush(self, thread_id: str):
+        for key in [key for key in self._buffers if key[0] == thread_id]:
+            buffer = self._buffers.pop(key)
+            checkpoint = buffer["checkpoint"]
+            # Blobs for every channel touched during the turn, at the version the final checkpoint points to
+            versions = {c: checkpoint["channel_versions"][c] for c in buffer["channels"] if c in checkpoint["channel_versions"]}
+            config = await self.saver.aput(buffer["parent_config"], checkpoint, buffer["metadata"], versions)
+            for writes, task_id, task_path in buffer["writes"]:
+                await self.saver.aput_writes(config, writes, task_id, task_path)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = configurable["thread_id"], configurable.get("checkpoint_ns", "")
+        if thread_id not in self._active:
+            return await self.saver.aput(config, checkpoint, metadata, new_versions)
+
+        buffer = self._buffers.setdefault((thread_id, checkpoint_ns), {"parent_config": config, "channels": set()})
+        buffer["checkpoint"] = checkpoint
+        buffer["metadata"] = metadata
+        buffer["channels"].update(new_versions)
+        buffer["writes"] = []  # writes against the previous checkpoint are folded into this one
+        buffer["config"] = {
+            "configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": checkpoint["id"]}
+        }
+        return buffer["config"]
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        buffer = self._buffer_for(config)
+        if buffer is None or buffer["checkpoint"]["id"] != config["configurable"].get("checkpoint_id"):
+            return await self.saver.aput_writes(config, writes, task_id, task_path)
+        buffer["writes"].append((list(writes), task_id, task_path))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        buffer = self._buffer_for(config)
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        if buffer is None or checkpoint_id not in (None, buffer["checkpoint"]["id"]):
+            return await self.saver.aget_tuple(config)
+        parent = buffer["parent_config"]
+        return CheckpointTuple(
+            config=buffer["config"],
+            checkpoint=buffer["checkpoint"],
+            metadata=buffer["metadata"],
+            parent_config=parent if parent["configurable"].get("checkpoint_id") else None,
+            pending_writes=[(task_id, channel, value) for writes, task_id, _ in buffer["writes"] for channel, value in writes],
+        )
+
+#? Hot thread cache
+class CachedCheckpointSaver(DelegatingCheckpointSaver):
+    """Write-through cache of each thread's latest checkpoint in front of another saver.
+    Loads for recently active threads skip the database query and blob deserialisation; every write still
+    goes to the wrapped saver first. Entries are evicted LRU beyond `max_size` and after `ttl` seconds."""
+    def __init__(self, saver: BaseCheckpointSaver, max_size: int, ttl: float):
+        super().__init__(saver)
+        self._cache = TTLCache(max_size, ttl)  # (thread_id, checkpoint_ns) -> CheckpointTuple
+
+    @staticmethod
+    def _key(config: RunnableConfig):
+        return config["configurable"]["thread_id"], config["configurable"].get("checkpoint_ns", "")
+
+    @staticmethod
+    def _copy(saved: CheckpointTuple):
+        # The pregel loop and the nodes mutate what they load, down to the channel values, so never hand out
+        # (or keep) an object a caller also holds. Still far cheaper than a query plus blob deserialisation
+        return deepcopy(saved)
+
+    def _detach(self, value):
+        """Round trip a pending write through the serializer, so the cache holds exactly what the saver would return."""
+        return self.serde.loads_typed(self.serde.dumps_typed(value))
+
+    def invalidate(self, thread_ids: list[str]):
+        thread_ids = set(thread_ids)
+        for key, _ in self._cache.items():
+            if key[0] in thread_ids:
+                self._cache.pop(key)
+
+    def stats(self):
+        return self._cache.stats()
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        checkpoint_id = config["configurable"].get("checkpoint_id")
+        key = self._key(config)
+        if checkpoint_id is None:
+            cached = self._cache.get(key)
+            if cached is not None:
+                return self._copy(cached)
+        else:
+            cached = self._cache.peek(key)
+            if cached is not None and cached.checkpoint["id"] == checkpoint_id:
+                return self._copy(cached)
+            return await self.saver.aget_tuple(config)
+
+        saved = await self.saver.aget_tuple(config)
+        if saved is not None:
+            self._cache.set(key, self._copy(saved))
+        return saved
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = await self.saver.aput(config, checkpoint, metadata, new_versions)
+        self._cache.set(self._key(config), CheckpointTuple(
+            config=next_config,
+            checkpoint=deepcopy(checkpoint),
+            metadata=get_checkpoint_metadata(config, metadata),
+            parent_config=config if config["configurable"].get("checkpoint_id") else None,
+            pending_writes=[],
+        ))
+        return next_config
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        await self.saver.aput_writes(config, writes, task_id, task_path)
+        key = self._key(config)
+        cached = self._cache.peek(key)
+        if cached is None or cached.checkpoint["id"] != config["configurable"].get("checkpoint_id"):
+            return
+        # Mirror the saver: special channels (interrupt, error, ...) overwrite, everything else appends
+        replaced = {(task_id, channel) for channel, _ in writes if channel in WRITES_IDX_MAP}
+        pending = [w for w in cached.pending_writes if (w[0], w[1]) not in replaced]
+        pending.extend((task_id, channel, self._detach(value)) for channel, value in writes)
+        self._cache.set(key, cached._replace(pending_writes=pending))
+
+#? Checkpoint I/O timing
+class TimedCheckpointSaver(DelegatingCheckpointSaver):
+    """Times every load and write against the wrapped saver into checkpoint_io_seconds and the current turn.
+    Sits directly on the database saver, so cache hits and buffered writes are not counted as I/O."""
+    async def _timed(self, op: str, call, *args):
+        start = time.perf_counter()
+        try:
+            return await call(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            CHECKPOINT_SECONDS.observe(elapsed, op)
+            stats = current_turn()
+            if stats is not None:
+                stats.checkpoint_seconds += elapsed
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await self._timed("get", self.saver.aget_tuple, config)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await self._timed("put", self.saver.aput, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        return await self._timed("put_writes", self.saver.aput_writes, config, writes, task_id, task_path)
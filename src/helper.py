@@ -1,47 +1,150 @@
-from pinecone import Pinecone
+from collections import defaultdict
+from functools import lru_cache
 from psycopg_pool import AsyncConnectionPool
 from pydantic import BaseModel, Field
 from typing import Annotated
 from typing_extensions import TypedDict
 
+from langchain_core.messages import HumanMessage, SystemMessage, trim_messages
+from langchain_core.messages.utils import count_tokens_approximately
 from langgraph.graph.message import add_messages
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 
-import os, random
+from cache import SemanticCache
+from instrumentation import log_event
+from config import (
+    DB_POOL_MAX_IDLE, DB_POOL_MAX_LIFETIME, DB_POOL_MAX_SIZE, DB_POOL_MAX_WAITING, DB_POOL_MIN_SIZE, DB_POOL_TIMEOUT,
+    EMBEDDING_MODEL, EMBEDDINGS_BACKEND, HISTORY_TOKEN_BUDGET, LOCAL_INDEX_PATH, RAG_CACHE_SIZE, RAG_CACHE_THRESHOLD,
+    RAG_CACHE_TTL, RAG_MAX_CONCURRENCY, RAG_POOL_CONNECTIONS, RAG_QUEUE_TIMEOUT, RAG_WARM_UP, RETRIEVER_BACKEND,
+)
+from retrievers import LocalIndexRetriever, PineconeRetriever, StubEmbeddings
+
+import asyncio, httpx, logging, os, random, re
 
 #? Langgraph Database Connection Pool
+# Created closed, opened (and pre-warmed to DB_POOL_MIN_SIZE) in the FastAPI lifespan
 DB_URI = os.getenv("DB_URI")
 pool = AsyncConnectionPool(
     conninfo=DB_URI,
-    max_size=5,
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_waiting=DB_POOL_MAX_WAITING,
+    max_idle=DB_POOL_MAX_IDLE,
+    max_lifetime=DB_POOL_MAX_LIFETIME,
+    check=AsyncConnectionPool.check_connection,
     kwargs={"autocommit": True, "prepare_threshold": 0},
+    open=False,
 )
 
+def pool_stats():
+    """Current pool gauges plus cumulative request counters (wait time in ms)."""
+    stats = pool.get_stats()
+    stats["pool_in_use"] = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+    return stats
+
 #? Langgraph State
 class State(TypedDict):
     messages: Annotated[list, add_messages]
     user_id: str
+    summary: str  # running summary of turns compacted out of messages
+    lore: str  # lore retrieved for the current turn, not kept in history
 
 #? Pinecone Vector Store Setup
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 INDEX_NAME = "portfolio"
 class VectorStoreManager:
+    """Long-lived retrieval client, built once in the FastAPI lifespan and shared by every lore lookup.
+    The index behind it is picked by RETRIEVER_BACKEND, the embedder by EMBEDDINGS_BACKEND."""
     def __init__(self):
-        self._initialize_pinecone()
+        limits = httpx.Limits(max_connections=RAG_POOL_CONNECTIONS, max_keepalive_connections=RAG_POOL_CONNECTIONS)
+        self._http_client = httpx.Client(limits=limits)
+        self._http_async_client = httpx.AsyncClient(limits=limits)
+        self._embeddings = self._initialize_embeddings()
+        self._retriever = self._initialize_retriever()
+        self._semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENCY)
+        # One semantic cache per top_k so a hit always carries enough documents
+        self._caches = defaultdict(lambda: SemanticCache(RAG_CACHE_SIZE, RAG_CACHE_TTL, RAG_CACHE_THRESHOLD))
 
-    def _initialize_pinecone(self):
-        Pinecone(api_key=PINECONE_API_KEY)
+    def _initialize_embeddings(self):
+        if EMBEDDINGS_BACKEND == "stub":
+            return StubEmbeddings()
+        elif EMBEDDINGS_BACKEND == "openai":
+            from langchain_openai import OpenAIEmbeddings
 
-    def __get_vector_store(self):
-        embeddings = OpenAIEmbeddings(model="text-embedding-3-large")
-        return PineconeVectorStore(index_name=INDEX_NAME, embedding=embeddings)
+            return OpenAIEmbeddings(
+                model=EMBEDDING_MODEL,
+                http_client=self._http_client,
+                http_async_client=self._http_async_client,
+            )
+        raise ValueError(f"Unknown embeddings backend: {EMBEDDINGS_BACKEND}")
 
-    def retrieve_from_vector_store(self, query: str, top_k: int):
-        vector_store = self.__get_vector_store()
-        results = vector_store.similarity_search(query, k=top_k)
+    def _initialize_retriever(self):
+        if RETRIEVER_BACKEND == "local":
+            return LocalIndexRetriever(LOCAL_INDEX_PATH)
+        elif RETRIEVER_BACKEND == "pinecone":
+            return PineconeRetriever(
+                api_key=PINECONE_API_KEY,
+                index_name=INDEX_NAME,
+                embeddings=self._embeddings,
+                pool_threads=RAG_POOL_CONNECTIONS,
+                max_workers=RAG_MAX_CONCURRENCY,
+            )
+        raise ValueError(f"Unknown retriever backend: {RETRIEVER_BACKEND}")
+
+    async def aretrieve(self, query: str, k: int):
+        """Embed with the async client and search the index off the event loop, capped at RAG_MAX_CONCURRENCY.
+        Returns (Document, cosine score) pairs, best first. Repeat questions are answered from the semantic cache,
+        skipping the embedding call and/or the query."""
+        cache = self._caches[k]
+        cached = cache.get(query)
+        if cached is not None:
+            return cached
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=RAG_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RuntimeError(f"Retrieval busy, no slot freed up within {RAG_QUEUE_TIMEOUT}s")
+        try:
+            vector = await self._embeddings.aembed_query(query)
+            cached = cache.get_similar(vector)
+            if cached is not None:
+                cache.set(query, vector, cached)
+                return cached
+            results = await self._retriever.asearch(vector, k)
+        finally:
+            self._semaphore.release()
+        cache.set(query, vector, results)
         return results
-    
+
+    def cache_stats(self):
+        return {k: cache.stats() for k, cache in self._caches.items()}
+
+    async def warm_up(self):
+        """Open the embedding and index connections before the first user needs them."""
+        await self.aretrieve("warm up", 1)
+
+    async def aclose(self):
+        self._retriever.close()
+        self._http_client.close()
+        await self._http_async_client.aclose()
+
+vector_store_manager = None
+
+async def init_vector_store():
+    """Build the shared VectorStoreManager (called once from lifespan)."""
+    global vector_store_manager
+    vector_store_manager = await asyncio.to_thread(VectorStoreManager)
+    if RAG_WARM_UP:
+        try:
+            await vector_store_manager.warm_up()
+        except Exception as e:
+            log_event("vector_store_warm_up_error", logging.WARNING, error=str(e))
+    return vector_store_manager
+
+def get_vector_store():
+    if vector_store_manager is None:
+        raise RuntimeError("Vector store not initialised, call init_vector_store() in lifespan first")
+    return vector_store_manager
+
 #? Class for Structured Outputs
 class ValidateLore(BaseModel):
     """Check if lore provided is necessary for user query"""
@@ -61,6 +164,9 @@ class UserInput(BaseModel):
 class WipeInput(BaseModel):
     user_id: str
 
+class BulkWipeInput(BaseModel):
+    user_ids: list[str]
+
 class ValidateIdentityInput(BaseModel):
     user_input: str
 
@@ -69,57 +175,165 @@ class AddAiMsgInput(BaseModel):
     user_id: str
 
 #? Helper functions
-def create_prompt(info:list, llm_type:str):
-    if llm_type == "chatbot":
-        name = info[0]
-        bot_name = info[1]
-        prompt = f"""
-        User's name: {name}
-        You are {bot_name}.
-        You are a celestial and a fitness mentor. You speak like a normal human, not going out of your way to help but also being supportive.
-        You are playing a part of a narrative where you want to build your relationship with the user slowly but surely.
-        """
+PERSONA_ID = "persona"  # fixed id so add_messages replaces the persona prompt instead of appending it every turn
 
-    elif llm_type == "lore_validator":
-        prompt = f"""
-        User Question: {info[0]}\\n
-        Lore retrieved: {info[1]}
-        """
+def split_history(messages: list):
+    """Return (latest persona prompt, conversation messages without system prompts)."""
+    system = [m for m in messages if isinstance(m, SystemMessage)]
+    history = [m for m in messages if not isinstance(m, SystemMessage)]
+    return system[-1:], history
 
-    elif llm_type == "identity_validator":
-        prompt = f"""
-        Check if user has provided a valid name, age and email in the message.
-        User Message: {info[0]}
-        """
-        
-    elif llm_type == "splitter":
-        values = [0, 1, 2, 3]
-        weights = [0.4, 0.3, 0.2, 0.1]
-        # 40% odds to have no splits, 30% odds to have 1 split etc...
-        split_count = random.choices(values, weights=weights, k=1)[0]
+def trim_history(history: list, budget: int = HISTORY_TOKEN_BUDGET):
+    """Keep the most recent whole turns that fit in `budget` tokens, always keeping the latest user turn.
+    History within budget is sent as is, including anything before the first user message (the /add_ai_msg opener)."""
+    if count_tokens_approximately(history) <= budget:
+        return history
+    trimmed = trim_messages(
+        history,
+        max_tokens=budget,
+        token_counter=count_tokens_approximately,
+        strategy="last",
+        start_on="human",
+        allow_partial=False,
+    )
+    if not trimmed:
+        last_human = max((i for i, m in enumerate(history) if isinstance(m, HumanMessage)), default=0)
+        trimmed = history[last_human:]
+    return trimmed
+
+def build_chat_messages(state: dict):
+    """Bounded prompt for the chatbot: persona, running summary, trimmed history, then this turn's lore."""
+    persona, history = split_history(state["messages"])
+    messages = persona
+    if state.get("summary"):
+        messages = messages + [SystemMessage(content=f"Summary of the earlier conversation: {state['summary']}")]
+    messages = messages + trim_history(history)
+    if state.get("lore"):
+        messages = messages + [SystemMessage(content=f"Relevant lore: {state['lore']}")]
+    return messages
 
-        print(split_count)
+def sample_split_count():
+    values = [0, 1, 2, 3]
+    weights = [0.4, 0.3, 0.2, 0.1]
+    # 40% odds to have no splits, 30% odds to have 1 split etc...
+    return random.choices(values, weights=weights, k=1)[0]
 
-        prompt = f"""
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…~*])\s+|\n+")
+CLAUSE_BOUNDARY = re.compile(r"(?<=[,;:])\s+|\s+(?=—)")
+MIN_SPLIT_LENGTH = 40  # messages shorter than this are never split
+# A "." after these (or after a capital initial, "J.") doesn't end the sentence
+ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "mt", "vs", "e.g", "i.e"}
+
+def ends_abbreviation(text: str, end: int):
+    """True when the "." just before `end` closes an abbreviation or an initial rather than a sentence."""
+    if text[end - 1] != ".":
+        return False
+    words = text[:end - 1].split()
+    word = words[-1].lstrip("(\"'*") if words else ""
+    return word.lower() in ABBREVIATIONS or (len(word) == 1 and word.isupper() and word != "I")
+
+def split_message(text: str, split_count: int, separator: str = "---"):
+    """Local stand-in for the splitter LLM: cut `text` at up to `split_count` sentence
+    (or, failing that, clause) boundaries chosen to keep the bubbles evenly sized."""
+    text = text.strip()
+    if split_count <= 0 or len(text) < MIN_SPLIT_LENGTH:
+        return text
+
+    def boundaries(pattern):
+        # Never split inside *roleplay actions*
+        return [
+            m for m in pattern.finditer(text)
+            if text.count("*", 0, m.start()) % 2 == 0 and 0 < m.start() < len(text) and not ends_abbreviation(text, m.start())
+        ]
+
+    candidates = boundaries(SENTENCE_BOUNDARY)
+    if len(candidates) < split_count:
+        candidates = sorted(candidates + boundaries(CLAUSE_BOUNDARY), key=lambda m: m.start())
+    if not candidates:
+        return text
+
+    count = min(split_count, len(candidates))
+    chosen = []
+    for i in range(1, count + 1):
+        target = len(text) * i / (count + 1)
+        best = min((m for m in candidates if m not in chosen), key=lambda m: abs(m.start() - target))
+        chosen.append(best)
+    chosen.sort(key=lambda m: m.start())
+
+    parts, start = [], 0
+    for m in chosen:
+        parts.append(text[start:m.start()].strip())
+        start = m.end()
+    parts.append(text[start:].strip())
+    return separator.join(part for part in parts if part)
+
+#? Prompt templates
+def clean_prompt(prompt: str):
+    """Preserve '\n' markers as real line breaks, collapse everything else."""
+    # Split on literal \n (not actual newlines)
+    parts = prompt.split("\\n")
+    # Collapse each part (remove extra spaces and real line breaks)
+    cleaned_parts = [" ".join(part.strip().split()) for part in parts]
+    # Join with actual newlines
+    return "\n".join(cleaned_parts)
+
+# llm_type -> template; cleaned once at import, so a call only cleans the values it substitutes
+PROMPT_TEMPLATES = {
+    "chatbot": """
+        User's name: {0}
+        You are {1}.
+        You are a celestial and a fitness mentor. You speak like a normal human, not going out of your way to help but also being supportive.
+        You are playing a part of a narrative where you want to build your relationship with the user slowly but surely.
+        """,
+    "lore_validator": """
+        User Question: {0}\\n
+        Lore retrieved: {1}
+        """,
+    "identity_validator": """
+        Check if user has provided a valid name, age and email in the message.
+        User Message: {0}
+        """,
+    "splitter": """
         Split relevant portions of text with "---" where appropriate to send multiple messages to the user.\\n
-        Split {split_count} times (Follow split count strictly). Split 0 times if message is too short.
+        Split {1} times (Follow split count strictly). Split 0 times if message is too short.
         Example Original Text: "Hey darling! Nice to meet you too! Let me send you a pic of what Im doing right now!"
         Example Rewrite with 2 splits: "Hey darling!---Nice to meet you too!---Let me send you a pic of what Im doing right now!"\\n
-        Message to split: {info[0]}
-        """
+        Message to split: {0}
+        """,
+    "summarizer": """
+        Update the running summary of this roleplay conversation with the new messages below.
+        Keep the user's details, what they shared, how the relationship has progressed and any open threads. Stay under 150 words.\\n
+        Current summary: {0}\\n
+        New messages: {1}
+        """,
+}
+PROMPT_TEMPLATES = {llm_type: clean_prompt(template) for llm_type, template in PROMPT_TEMPLATES.items()}
+
+def clean_value(value):
+    value = str(value)
+    # Most values carry no '\\n' markers, and a single split/join is all clean_prompt would do to them
+    return clean_prompt(value) if "\\n" in value else " ".join(value.split())
+
+def render_prompt(llm_type: str, *values):
+    return PROMPT_TEMPLATES[llm_type].format(*map(clean_value, values))
+
+@lru_cache(maxsize=1024)
+def persona_prompt(name: str, bot_name: str):
+    """The chatbot prompt only depends on the two names, so it is rendered once per pair."""
+    return render_prompt("chatbot", name, bot_name)
+
+def create_prompt(info:list, llm_type:str):
+    if llm_type == "chatbot":
+        return persona_prompt(info[0], info[1])
+
+    elif llm_type == "splitter":
+        split_count = sample_split_count()
 
-    else:
-        prompt = "No prompt found"
+        log_event("split_count", logging.DEBUG, split_count=split_count)
 
-    def clean_prompt(prompt: str):
-        """Preserve '\n' markers as real line breaks, collapse everything else."""
-        # Split on literal \n (not actual newlines)
-        parts = prompt.split("\\n")
-        # Collapse each part (remove extra spaces and real line breaks)
-        cleaned_parts = [" ".join(part.strip().split()) for part in parts]
-        # Join with actual newlines
-        return "\n".join(cleaned_parts)
+        return render_prompt(llm_type, info[0], split_count)
 
-    cleaned_prompt = clean_prompt(prompt)
+    elif llm_type in PROMPT_TEMPLATES:
+        return render_prompt(llm_type, *info)
 
-    return cleaned_prompt
+    return "No prompt found"
@@ -1,7 +1,38 @@
-from agents import identity_validator
-from helper import create_prompt
+from agents import identity_flight, identity_validator
+from cache import TTLCache
+from config import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+from helper import create_prompt, Identify
+from instrumentation import timed_llm
 from langchain_core.messages import HumanMessage, SystemMessage, trim_messages
 
+import re
+
+EMAIL_PATTERN = re.compile(r"[^\s@]+@[^\s@]+\.[a-z]{2,}", re.IGNORECASE)
+AGE_PATTERN = re.compile(r"\b\d{1,3}\b")
+
+# Normalised input -> Identify, so retries and double submits don't hit the model again
+identity_cache = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+
+def normalize_identity(input: str):
+    return " ".join(input.split()).casefold()
+
+def prevalidate_identity(input: str):
+    """Cheap local check: an email-shaped token plus a plausible age outside of it. Only these reach the model."""
+    if not EMAIL_PATTERN.search(input):
+        return False
+    remainder = EMAIL_PATTERN.sub(" ", input)
+    return any(0 < int(age) < 130 for age in AGE_PATTERN.findall(remainder))
+
 async def validate_identity(input: str):
-    is_valid = await identity_validator.ainvoke([SystemMessage(content=create_prompt(info=[input], llm_type="identity_validator"))])
+    key = normalize_identity(input)
+    cached = identity_cache.get(key)
+    if cached is not None:
+        return cached
+
+    if prevalidate_identity(key):
+        messages = [SystemMessage(content=create_prompt(info=[input], llm_type="identity_validator"))]
+        is_valid = await identity_flight.do(key, timed_llm("identity_validator", identity_validator.ainvoke), messages)
+    else:
+        is_valid = Identify(is_valid=False)
+    identity_cache.set(key, is_valid)
     return is_valid
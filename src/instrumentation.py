@@ -0,0 +1,208 @@
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import wraps
+from logging.handlers import QueueHandler, QueueListener
+
+from config import LOG_LEVEL
+
+import asyncio, json, logging, queue, sys, time
+
+#? Metrics (Prometheus text exposition, no client library)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Metric:
+    registry = []
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}  # label values -> metric state
+        Metric.registry.append(self)
+
+    def _label_text(self, values: tuple, extra: str = ""):
+        pairs = [f'{label}="{value}"' for label, value in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{self._label_text(labels)} {value}"
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, *labels):
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                state["counts"][i] += 1
+        state["sum"] += value
+        state["count"] += 1
+
+    def samples(self):
+        for labels, state in self._values.items():
+            for bound, count in zip([*self.buckets, "+Inf"], [*state["counts"], state["count"]]):
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{self._label_text(labels, le)} {count}"
+            yield f"{self.name}_sum{self._label_text(labels)} {state['sum']}"
+            yield f"{self.name}_count{self._label_text(labels)} {state['count']}"
+
+def render_metrics() -> str:
+    lines = []
+    for metric in Metric.registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+TURN_SECONDS = Histogram("chat_turn_seconds", "Wall time of one chat turn.", ("endpoint", "outcome"))
+NODE_SECONDS = Histogram("graph_node_seconds", "Wall time of one graph node run.", ("node",))
+NODE_ERRORS = Counter("graph_node_errors_total", "Graph node runs that raised.", ("node",))
+LLM_SECONDS = Histogram("llm_request_seconds", "Model call latency.", ("model", "outcome"))
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the provider.", ("model", "kind"))
+CHAT_PROVIDER = Counter("chat_provider_wins_total", "Chat turns answered by each provider.", ("provider",))
+CHAT_RETRIES = Counter("chat_retries_total", "Extra chat provider calls (hedges) beyond the first.")
+RETRIEVAL_SECONDS = Histogram("retrieval_seconds", "Lore retrieval latency, cache hits included.")
+CHECKPOINT_SECONDS = Histogram("checkpoint_io_seconds", "Checkpointer round trips to the database.", ("op",))
+
+#? Structured logs
+# Records go through a queue and are written by a listener thread, so logging never blocks the event loop
+logger = logging.getLogger("stellarbloom")
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+
+def start_logging():
+    _log_listener.start()
+
+def stop_logging():
+    _log_listener.stop()
+
+def log_event(event: str, level: int = logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, json.dumps({"ts": time.time(), "event": event, **fields}, default=str))
+
+#? Per turn accounting
+class TurnStats:
+    def __init__(self, endpoint: str, thread_id: str):
+        self.endpoint = endpoint
+        self.thread_id = thread_id
+        self.nodes = {}  # node -> seconds, summed over its runs this turn
+        self.provider = None
+        self.chat_calls = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retrieval_seconds = 0.0
+        self.checkpoint_seconds = 0.0
+
+_current_turn = ContextVar("current_turn", default=None)
+
+def current_turn():
+    return _current_turn.get()
+
+@asynccontextmanager
+async def track_turn(endpoint: str, thread_id: str):
+    """Collect what the turn's nodes record, then export it as metrics and one structured "turn" log line."""
+    stats = TurnStats(endpoint, thread_id)
+    token = _current_turn.set(stats)
+    start, outcome = time.perf_counter(), "ok"
+    try:
+        yield stats
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        _current_turn.reset(token)
+        duration = time.perf_counter() - start
+        TURN_SECONDS.observe(duration, endpoint, outcome)
+        log_event(
+            "turn",
+            endpoint=endpoint,
+            thread_id=thread_id,
+            outcome=outcome,
+            seconds=round(duration, 4),
+            nodes={node: round(seconds, 4) for node, seconds in stats.nodes.items()},
+            provider=stats.provider,
+            retries=stats.retries,
+            prompt_tokens=stats.prompt_tokens,
+            completion_tokens=stats.completion_tokens,
+            retrieval_seconds=round(stats.retrieval_seconds, 4),
+            checkpoint_seconds=round(stats.checkpoint_seconds, 4),
+        )
+
+def timed_node(name: str, node):
+    """Wrap a graph node so each run is timed into graph_node_seconds and the current turn."""
+    @wraps(node)
+    async def wrapper(state):
+        start = time.perf_counter()
+        try:
+            return await node(state)
+        except BaseException:
+            NODE_ERRORS.inc(name)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            NODE_SECONDS.observe(elapsed, name)
+            stats = current_turn()
+            if stats is not None:
+                stats.nodes[name] = stats.nodes.get(name, 0.0) + elapsed
+    return wrapper
+
+def timed_llm(model: str, call, chat: bool = False):
+    """Wrap a model call: latency by outcome, token usage when the provider reports it.
+    `chat` calls are also counted on the turn, which is how observe_chat sees hedges."""
+    async def wrapper(*args, **kwargs):
+        stats = current_turn()
+        if chat and stats is not None:
+            stats.chat_calls += 1
+        start, outcome = time.perf_counter(), "ok"
+        try:
+            result = await call(*args, **kwargs)
+        except BaseException as e:
+            outcome = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+            raise
+        finally:
+            LLM_SECONDS.observe(time.perf_counter() - start, model, outcome)
+        usage = getattr(result, "usage_metadata", None)
+        if usage:
+            LLM_TOKENS.inc(model, "prompt", amount=usage.get("input_tokens", 0))
+            LLM_TOKENS.inc(model, "completion", amount=usage.get("output_tokens", 0))
+            if stats is not None:
+                stats.prompt_tokens += usage.get("input_tokens", 0)
+                stats.completion_tokens += usage.get("output_tokens", 0)
+        return result
+    return wrapper
+
+async def observe_chat(run, *args, **kwargs):
+    """Await a HedgedScheduler.run, recording the winning provider and any extra (hedged) provider calls."""
+    stats = current_turn()
+    calls = stats.chat_calls if stats is not None else 0
+    try:
+        result, provider = await run(*args, **kwargs)
+    finally:
+        if stats is not None:
+            extra = stats.chat_calls - calls - 1
+            if extra > 0:
+                stats.retries += extra
+                CHAT_RETRIES.inc(amount=extra)
+    CHAT_PROVIDER.inc(provider)
+    if stats is not None:
+        stats.provider = provider
+    return result, provider
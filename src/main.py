@@ -1,21 +1,38 @@
 from collections import deque
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, nullcontext
 from dotenv import load_dotenv
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import AsyncGenerator
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage, trim_messages
+from langgraph.checkpoint.memory import MemorySaver
 from langgraph.checkpoint.postgres.aio import AsyncPostgresSaver
 from langgraph.types import Command
+from psycopg_pool import PoolTimeout, TooManyRequests
 
-from build_graph import graph_builder
-from config import CORS_ORIGINS
-from helper import pool, create_prompt, AddAiMsgInput, UserInput, ValidateIdentityInput, WipeInput
-from independents import validate_identity
+from admission import AdmissionLimiter, Overloaded, ThreadTurnQueue, MERGED
+from agents import guard, models
+from build_graph import compact_history, needs_compaction, FINAL_NODE, graph_builder
+from checkpoint import BufferedCheckpointSaver, CachedCheckpointSaver, TimedCheckpointSaver
+from config import (
+    CHECKPOINT_MODE, CHECKPOINTER, CORS_ORIGINS, DB_POOL_TIMEOUT, GRACEFUL_SHUTDOWN_TIMEOUT, HISTORY_SUMMARY,
+    MAX_ACTIVE_TURNS, MAX_QUEUED_PER_THREAD, MAX_QUEUED_TURNS, MODEL_WARM_UP, SPLITTER_MODE, SWEEP_BATCH_SIZE,
+    SWEEP_INTERVAL, THREAD_CACHE_SIZE, THREAD_CACHE_TTL, THREAD_IDLE_TTL, THREAD_QUEUE_TIMEOUT, TURN_MERGE_WINDOW,
+    TURN_QUEUE_TIMEOUT,
+)
+from helper import (
+    pool, pool_stats, create_prompt, get_vector_store, init_vector_store, PERSONA_ID,
+    AddAiMsgInput, BulkWipeInput, UserInput, ValidateIdentityInput, WipeInput,
+)
+from independents import identity_cache, validate_identity
+from instrumentation import log_event, render_metrics, start_logging, stop_logging, track_turn
+from ratelimit import CircuitOpen, RateLimited
+from singleflight import singleflight_stats
+from threads import clear_threads, run_sweeper
 
-import asyncio, json, os, sys
+import asyncio, json, logging, os, sys, time
 
 load_dotenv()
 DB_URI = os.getenv("DB_URI")
@@ -25,13 +42,33 @@ if sys.platform.startswith('win'):
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
 graph = None
+checkpointer = None
+thread_cache = None
+admission = AdmissionLimiter(MAX_ACTIVE_TURNS, MAX_QUEUED_TURNS, TURN_QUEUE_TIMEOUT)
+turn_queue = ThreadTurnQueue(TURN_MERGE_WINDOW, MAX_QUEUED_PER_THREAD, THREAD_QUEUE_TIMEOUT)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Keep the connection pool open as long as the app is alive."""
-    global graph
-  
-    checkpointer = AsyncPostgresSaver(pool)
-    # await checkpointer.setup()
+    global graph, checkpointer, thread_cache
+
+    start_logging()
+    warm_up = None
+    if MODEL_WARM_UP:
+        # Provider SDK imports and client construction run in a thread while the pool and vector store come up
+        warm_up = asyncio.create_task(asyncio.to_thread(models.warm_up), name="model_warm_up")
+        warm_up.add_done_callback(log_task_error)
+    vector_store = await init_vector_store()
+    if CHECKPOINTER == "memory":
+        checkpointer = MemorySaver()
+    else:
+        await pool.open(wait=True, timeout=DB_POOL_TIMEOUT * 6)
+        checkpointer = AsyncPostgresSaver(pool)
+        # await checkpointer.setup()
+    checkpointer = TimedCheckpointSaver(checkpointer)
+    if THREAD_CACHE_SIZE > 0:
+        checkpointer = thread_cache = CachedCheckpointSaver(checkpointer, THREAD_CACHE_SIZE, THREAD_CACHE_TTL)
+    if CHECKPOINT_MODE == "turn":
+        checkpointer = BufferedCheckpointSaver(checkpointer)
     graph = graph_builder.compile(checkpointer=checkpointer)
     
     # try:
@@ -40,13 +77,30 @@ async def lifespan(app: FastAPI):
     # except Exception as e:
     #     print("Exception while generating graph_output.png:", e)
 
+    sweeper = None
+    if THREAD_IDLE_TTL > 0 and CHECKPOINTER != "memory":
+        sweeper = asyncio.create_task(run_sweeper(SWEEP_INTERVAL, THREAD_IDLE_TTL, SWEEP_BATCH_SIZE))
+
     # print("✅ Connection pool and graph initialized!")
     yield  # Yield control back to FastAPI while keeping the pool open
 
+    if sweeper:
+        sweeper.cancel()
+    if warm_up:
+        # Stops waiting on it; a build already running in the thread finishes on its own
+        warm_up.cancel()
+        await asyncio.gather(warm_up, return_exceptions=True)
+    await drain_turns(GRACEFUL_SHUTDOWN_TIMEOUT)
     await pool.close()
-    print("❌ Connection pool closed!")
+    await vector_store.aclose()
+    log_event("pool_closed")
+    stop_logging()
 
 app = FastAPI(lifespan=lifespan)
+
+def log_task_error(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        log_event("background_task_error", logging.ERROR, task=task.get_name(), error=str(task.exception()))
 app.add_middleware(
     CORSMiddleware,
     allow_origins=CORS_ORIGINS,
@@ -55,47 +109,197 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-async def stream_graph_updates(user_id: str, user_input: str, config: dict, name: str, bot_name: str):
-    state = {
-        "messages": [SystemMessage(content=create_prompt(info=[name, bot_name], llm_type="chatbot")), {"role": "user", "content": user_input}],
+def db_busy():
+    """Fail fast with a retryable 503 when no pooled connection frees up in time."""
+    return HTTPException(status_code=503, detail="Database busy, try again shortly.", headers={"Retry-After": "1"})
+
+def overloaded(error: Overloaded):
+    return HTTPException(status_code=error.status_code, detail=error.detail, headers={"Retry-After": str(error.retry_after)})
+
+def checkpoint_turn(thread_id: str):
+    """Scope of one /chat turn; in CHECKPOINT_MODE=turn checkpoints are written once when it exits."""
+    if isinstance(checkpointer, BufferedCheckpointSaver):
+        return checkpointer.turn(thread_id)
+    return nullcontext()
+
+active_turns = 0
+background_tasks = set()  # post-turn work (history compaction), drained on shutdown along with turns
+compacting = set()  # thread_ids with a compaction scheduled
+TURN_STREAM_MODES = ["updates", "values"] if HISTORY_SUMMARY else ["updates"]  # values: the final state, for compaction
+
+@asynccontextmanager
+async def chat_turn(endpoint: str, thread_id: str):
+    """One chat turn: instrumented, checkpointed per CHECKPOINT_MODE and counted so shutdown can drain it.
+    Yields a dict the run fills with its final graph state ("state"), left unset if it stopped on an interrupt."""
+    global active_turns
+    active_turns += 1
+    turn = {}
+    try:
+        async with track_turn(endpoint, thread_id), checkpoint_turn(thread_id):
+            yield turn
+        state = turn.get("state")
+        if HISTORY_SUMMARY and state and needs_compaction(state):
+            schedule_compaction(thread_id, state)
+    finally:
+        active_turns -= 1
+
+def schedule_compaction(thread_id: str, state: dict):
+    if thread_id in compacting:
+        return
+    compacting.add(thread_id)
+    task = asyncio.create_task(compact_thread(thread_id, state))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def compact_thread(thread_id: str, state: dict):
+    """Roll old turns into the summary after the reply has gone out, so the summarizer call never adds to a response.
+    `state` is the final state of the turn that just ran. The summary is written without holding up the thread; only
+    applying it queues behind the thread's turns, and it stays valid on top of turns that ran meanwhile since it only
+    removes the older messages it summarised."""
+    config = {"configurable": {"thread_id": thread_id}}
+    try:
+        update = await compact_history(state)
+        if not update:
+            return
+        async with turn_queue.serialize(thread_id):
+            current = await graph.aget_state(config)
+            if current.next:
+                return
+            ids = {m.id for m in current.values.get("messages", [])}
+            update["messages"] = [m for m in update["messages"] if m.id in ids]
+            await graph.aupdate_state(config, update, as_node="compact")
+    except Overloaded:
+        pass  # the thread is busy; its next turn schedules another attempt
+    except Exception as e:
+        log_event("compaction_error", logging.WARNING, thread_id=thread_id, error=str(e))
+    finally:
+        compacting.discard(thread_id)
+
+async def drain_turns(timeout: float):
+    """Wait for running turns and post-turn work to flush before the pool closes. A /chat/stream turn whose client
+    disconnected is not among them: Starlette cancels the response generator, which stops its run where it was."""
+    deadline = time.monotonic() + timeout
+    while (active_turns or background_tasks) and time.monotonic() < deadline:
+        await asyncio.sleep(0.1)
+    if active_turns or background_tasks:
+        log_event("shutdown_incomplete", logging.WARNING, turns=active_turns, background_tasks=len(background_tasks))
+
+def forget_threads(thread_ids: list[str]):
+    if thread_cache is not None:
+        thread_cache.invalidate(thread_ids)
+
+def build_turn_state(user_id: str, user_input: str, name: str, bot_name: str):
+    return {
+        "messages": [
+            SystemMessage(content=create_prompt(info=[name, bot_name], llm_type="chatbot"), id=PERSONA_ID),
+            {"role": "user", "content": user_input},
+        ],
         "user_id": user_id,
     }
-    
-    async for event in graph.astream(state, config):
+
+async def stream_graph_updates(user_id: str, user_input: str, config: dict, name: str, bot_name: str, turn: dict):
+    state = build_turn_state(user_id, user_input, name, bot_name)
+    result = None
+
+    # Drain the whole run so it finishes writing its checkpoint
+    async for mode, event in graph.astream(state, config, stream_mode=TURN_STREAM_MODES):
+        if mode == "values":
+            turn["state"] = event
+            continue
         msg = ""
         if "__interrupt__" in event:
+            turn.pop("state", None)
             return {"response":"", "other_name":"interrupt", "other_msg": None} #TODO: Turn other msg into tool name
 
         elif "tools" in event:
             # For tools that don't require human review
             pass
 
-        elif "splitter" in event:
-            for value in event.values():
-                msg = value["messages"][-1].content
+        elif FINAL_NODE in event:
+            message = event[FINAL_NODE]["messages"][-1]
+            if not message.tool_calls:
+                msg = message.content
 
-        if msg:
-            return {"response": msg, "other_name": None, "other_msg": None}
+        if msg and result is None:
+            result = {"response": msg, "other_name": None, "other_msg": None}
 
-        
-async def clear_thread(thread_id: str):
-    """Deletes all records related to the given thread_id."""
-    async with pool.connection() as conn:
-        async with conn.cursor() as cursor:
-            try:
-                await cursor.execute("DELETE FROM checkpoints WHERE thread_id = %s", (thread_id,))
-                await cursor.execute("DELETE FROM checkpoint_writes WHERE thread_id = %s", (thread_id,))
-                await cursor.execute("DELETE FROM checkpoint_blobs WHERE thread_id = %s", (thread_id,))
+    return result
+
+
+def ndjson_event(type: str, **fields):
+    return json.dumps({"type": type, **fields}) + "\n"
+
+async def stream_chat_events(user_id: str, user_input: str, config: dict, name: str, bot_name: str) -> AsyncGenerator[str, None]:
+    """Yield NDJSON events for one turn as the graph runs:
+    token (raw model text), bubble (a complete "---" segment), tool, interrupt, reset, done and error.
+    A reset means tokens and bubbles already sent belong to a reply that was discarded (a losing hedged call or a tool call)."""
+    state = build_turn_state(user_id, user_input, name, bot_name)
+    active_id, buffer, streamed, finished = None, "", False, False
+
+    try:
+        async with turn_queue.serialize(user_id), admission.admit(), chat_turn("chat_stream", user_id) as turn:
+            async for mode, payload in graph.astream(state, config, stream_mode=["messages", *TURN_STREAM_MODES]):
+                if mode == "values":
+                    turn["state"] = payload
+                    continue
+                if finished:
+                    continue  # let the run finish writing its checkpoint
+                if mode == "messages":
+                    chunk, metadata = payload
+                    if metadata.get("langgraph_node") != FINAL_NODE or not isinstance(chunk.content, str) or not chunk.content:
+                        continue
+                    # Hedged providers stream concurrently, follow whichever produced text first
+                    active_id = active_id or chunk.id
+                    if chunk.id != active_id:
+                        continue
+                    streamed = True
+                    yield ndjson_event("token", content=chunk.content)
+                    if SPLITTER_MODE == "llm":
+                        buffer += chunk.content
+                        *bubbles, buffer = buffer.split("---")
+                        for bubble in bubbles:
+                            if bubble.strip():
+                                yield ndjson_event("bubble", content=bubble.strip())
+                    continue
+
+                if "__interrupt__" in payload:
+                    turn.pop("state", None)
+                    yield ndjson_event("interrupt", value=[str(i.value) for i in payload["__interrupt__"]])
+                    return
 
-                await conn.commit()
-                # print(f"✅ Wiped data for thread_id: {thread_id}")
-                return {"response": True, "other_name": None, "other_msg": None}
+                chatbot_message = (payload.get("chatbot") or {}).get("messages", [None])[-1]
+                if chatbot_message is not None and chatbot_message.tool_calls:
+                    if streamed:
+                        yield ndjson_event("reset")
+                    for tool_call in chatbot_message.tool_calls:
+                        yield ndjson_event("tool", name=tool_call["name"])
+                    active_id, buffer, streamed = None, "", False
+                    continue
 
-            except Exception as exception:
-                await conn.rollback()
-                print(f"❌ Error in wipe(): {exception}")
-                return {"response": False, "other_name": None, "other_msg": None}
+                if FINAL_NODE not in payload:
+                    continue
+                message = payload[FINAL_NODE]["messages"][-1]
+                mismatch = streamed and message.id != active_id
+                if mismatch:
+                    yield ndjson_event("reset")
 
+                if SPLITTER_MODE == "llm" and not mismatch:
+                    bubbles = [buffer] if streamed else message.content.split("---")
+                else:
+                    bubbles = message.content.split("---")
+                for bubble in bubbles:
+                    if bubble.strip():
+                        yield ndjson_event("bubble", content=bubble.strip())
+                yield ndjson_event("done", response=message.content)
+                finished = True
+
+    except Overloaded as e:
+        yield ndjson_event("error", detail=e.detail, retry_after=e.retry_after)
+    except (PoolTimeout, TooManyRequests):
+        yield ndjson_event("error", detail="Database busy, try again shortly.", retry_after=1)
+    except Exception as e:
+        log_event("chat_stream_error", logging.ERROR, thread_id=user_id, error=str(e))
+        yield ndjson_event("error", detail=str(e))
 
 @app.post("/chat")
 async def chat(input: UserInput):
@@ -109,15 +313,42 @@ async def chat(input: UserInput):
             raise HTTPException(status_code=400, detail=f"Input not provided: {input}")
 
         config = {"configurable": {"thread_id": user_id}}
-        
-        result = await stream_graph_updates(user_id, user_input, config, name, bot_name)
+
+        async def run_turn(user_input: str):
+            async with admission.admit(), chat_turn("chat", user_id) as turn:
+                return await stream_graph_updates(user_id, user_input, config, name, bot_name, turn)
+
+        # One turn at a time per thread; with TURN_MERGE_WINDOW, queued messages are answered as one turn
+        result = await turn_queue.submit(user_id, user_input, run_turn)
+        if result is MERGED:
+            return {"response": "", "other_name": "merged", "other_msg": None}
 
         return result
-    
+
+    except Overloaded as e:
+        raise overloaded(e)
+    except (PoolTimeout, TooManyRequests):
+        raise db_busy()
     except Exception as e:
-        print("Chat Error: ", e)
+        log_event("chat_error", logging.ERROR, thread_id=input.user_id, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/chat/stream")
+async def chat_stream(input: UserInput):
+    """Same as /chat, but streams NDJSON events so the first bubble arrives before the turn is finished."""
+    if not input.user_id:
+        raise HTTPException(status_code=400, detail=f"Input not provided: {input}")
+    try:
+        admission.check()  # the slot itself is taken once the stream starts
+    except Overloaded as e:
+        raise overloaded(e)
+
+    config = {"configurable": {"thread_id": input.user_id}}
+    return StreamingResponse(
+        stream_chat_events(input.user_id, input.user_input, config, input.name, input.bot_name),
+        media_type="application/x-ndjson",
+    )
+
 @app.post("/wipe")
 # Should be used to wipe history when user leaves site or wants to
 async def wipe(input: WipeInput):
@@ -125,19 +356,49 @@ async def wipe(input: WipeInput):
         user_id = input.user_id
         if not user_id:
             raise HTTPException(status_code=400, detail="User ID is required.")
-        result = await clear_thread(user_id)
-        return result
-        
+        try:
+            await clear_threads([user_id])
+            forget_threads([user_id])
+            return {"response": True, "other_name": None, "other_msg": None}
+        except (PoolTimeout, TooManyRequests):
+            raise
+        except Exception as exception:
+            log_event("wipe_error", logging.ERROR, thread_id=user_id, error=str(exception))
+            return {"response": False, "other_name": None, "other_msg": None}
+
+    except (PoolTimeout, TooManyRequests):
+        raise db_busy()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
+@app.post("/wipe_bulk")
+# Wipes many users in one statement, e.g. for batched leave events from the frontend
+async def wipe_bulk(input: BulkWipeInput):
+    try:
+        user_ids = [user_id for user_id in input.user_ids if user_id]
+        if not user_ids:
+            raise HTTPException(status_code=400, detail="User IDs are required.")
+        await clear_threads(user_ids)
+        forget_threads(user_ids)
+        return {"response": True, "other_name": None, "other_msg": None}
+
+    except HTTPException:
+        raise
+    except (PoolTimeout, TooManyRequests):
+        raise db_busy()
+    except Exception as e:
+        log_event("wipe_bulk_error", logging.ERROR, threads=len(input.user_ids), error=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/identify")
 async def identify(input: ValidateIdentityInput):
     try:
         is_valid = await validate_identity(input.user_input)
         return is_valid
+    except (CircuitOpen, RateLimited) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        print(e)
+        log_event("identify_error", logging.ERROR, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post("/add_ai_msg")
@@ -157,6 +418,38 @@ async def add_ai_msg(input: AddAiMsgInput):
         await graph.aupdate_state(config, {"messages": [transformed_ai_msg]})
 
         return {"response": "Successfully added ai message"}
+    except (PoolTimeout, TooManyRequests):
+        raise db_busy()
     except Exception as e:
-        print(e)
+        log_event("add_ai_msg_error", logging.ERROR, thread_id=input.user_id, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cache_stats")
+async def get_cache_stats():
+    """Hit ratios for the hot thread, lore retrieval and /identify caches, plus coalesced call counts."""
+    return {
+        "threads": thread_cache.stats() if thread_cache is not None else None,
+        "retrieval": get_vector_store().cache_stats(),
+        "identity": identity_cache.stats(),
+        "coalesced": singleflight_stats(),
+    }
+
+@app.get("/admission_stats")
+async def get_admission_stats():
+    """Turns running and queued against MAX_ACTIVE_TURNS, rejections, timeouts, per chat queue shedding and merged messages."""
+    return {**admission.stats(), **turn_queue.stats()}
+
+@app.get("/provider_stats")
+async def get_provider_stats():
+    """Circuit breaker state per model provider and the request/token budget left in each bucket."""
+    return guard.stats()
+
+@app.get("/pool_stats")
+async def get_pool_stats():
+    """Postgres pool size, in use / idle connections, queued requests and cumulative wait time."""
+    return pool_stats()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition: turn, node, model, retrieval and checkpoint I/O latencies, tokens and retries."""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,169 @@
+from typing import Awaitable, Callable
+
+import asyncio, time
+
+#? Errors
+class RateLimited(Exception):
+    """The call would have had to queue past RATE_LIMIT_MAX_WAIT for request/token budget."""
+
+class CircuitOpen(Exception):
+    """The provider is failing; calls are refused until the breaker lets a trial call through."""
+
+#? Token bucket
+class TokenBucket:
+    """`per_minute` units, refilled continuously and capped at one minute's worth. Waiters queue FIFO,
+    so a burst from one endpoint can't starve calls that arrived earlier from another."""
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float, deadline: float):
+        amount = min(amount, self.capacity)  # a call bigger than the whole budget still goes through on its own
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return
+                wait = (amount - self.level) / self.rate
+                if time.monotonic() + wait > deadline:
+                    raise RateLimited(f"Rate limit budget exhausted, next slot in {wait:.1f}s")
+                await asyncio.sleep(wait)
+
+    def adjust(self, amount: float):
+        """Charge (or refund, if negative) after the fact, e.g. actual minus estimated tokens. May go below zero."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+#? Circuit breaker
+class CircuitBreaker:
+    """Opens after `failures` consecutive errors and refuses calls for `reset_after` seconds,
+    then lets a single trial call through: success closes it again, failure re-opens it."""
+    def __init__(self, failures: int, reset_after: float):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def before_call(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_after:
+                raise CircuitOpen("Provider circuit open")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial:
+                raise CircuitOpen("Provider circuit half open, trial call in flight")
+            self._trial = True
+
+    def record(self, ok: bool):
+        self._trial = False
+        if ok:
+            self.state, self.failures = "closed", 0
+            return
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.max_failures:
+            self.state, self.opened_at = "open", time.monotonic()
+
+    def release(self):
+        """The call was cancelled (e.g. a losing hedge): neither a success nor a failure."""
+        self._trial = False
+
+#? Shared guard for every model client
+class ProviderGuard:
+    """Request and token budgets per provider and per model, plus one circuit breaker per provider.
+    Limits are totals for the deployment and are divided by `share` (the number of worker processes)."""
+    def __init__(
+        self,
+        provider_limits: dict,
+        model_limits: dict,
+        max_wait: float,
+        breaker_failures: int,
+        breaker_reset: float,
+        share: int = 1,
+        retry_backoff: float = 0.5,
+    ):
+        self.max_wait = max_wait
+        self.retry_backoff = retry_backoff  # seconds before the first retry, doubling after each
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self._buckets = {}  # (scope, "rpm" | "tpm") -> TokenBucket
+        for scope, limits in [*provider_limits.items(), *model_limits.items()]:
+            for kind in ("rpm", "tpm"):
+                if limits.get(kind):
+                    self._buckets[(scope, kind)] = TokenBucket(limits[kind] / share)
+        self._breakers = {}
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self._breakers:
+            self._breakers[provider] = CircuitBreaker(self.breaker_failures, self.breaker_reset)
+        return self._breakers[provider]
+
+    async def call(self, provider: str, model: str, tokens: int, fn: Callable[[], Awaitable], retries: int = 0):
+        """Run `fn` once the provider's circuit and the provider + model budgets allow it, retrying a failed call
+        up to `retries` times. Every attempt goes back through the breaker and the budgets, so retries can't pile
+        onto a provider that is down or over its limits. CircuitOpen and RateLimited are never retried."""
+        for attempt in range(retries + 1):
+            try:
+                return await self._call_once(provider, model, tokens, fn)
+            except (CircuitOpen, RateLimited):
+                raise
+            except Exception:
+                if attempt == retries:
+                    raise
+                await asyncio.sleep(self.retry_backoff * 2 ** attempt)
+
+    async def _call_once(self, provider: str, model: str, tokens: int, fn: Callable[[], Awaitable]):
+        """`tokens` is the estimate charged up front; `fn`'s usage_metadata, if any, settles the difference."""
+        breaker = self.breaker(provider)
+        breaker.before_call()
+
+        charged = []
+        try:
+            deadline = time.monotonic() + self.max_wait
+            for scope in (provider, model):
+                for kind, amount in (("rpm", 1), ("tpm", tokens)):
+                    bucket = self._buckets.get((scope, kind))
+                    if bucket is not None:
+                        await bucket.acquire(amount, deadline)
+                        charged.append((bucket, amount))
+        except BaseException:
+            breaker.release()
+            for bucket, amount in charged:
+                bucket.adjust(-amount)
+            raise
+
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            breaker.release()
+            raise
+        except Exception:
+            breaker.record(ok=False)
+            raise
+        breaker.record(ok=True)
+
+        usage = getattr(result, "usage_metadata", None)
+        if usage:
+            for scope in (provider, model):
+                bucket = self._buckets.get((scope, "tpm"))
+                if bucket is not None:
+                    bucket.adjust(usage.get("total_tokens", tokens) - tokens)
+        return result
+
+    def stats(self):
+        return {
+            "breakers": {
+                provider: {"state": breaker.state, "failures": breaker.failures} for provider, breaker in self._breakers.items()
+            },
+            "budgets": {f"{scope}:{kind}": round(bucket.level, 1) for (scope, kind), bucket in self._buckets.items()},
+        }
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import asyncio, hashlib, json, os, re
+import numpy as np
+
+#? Embedders
+class StubEmbeddings(Embeddings):
+    """Deterministic hashed bag-of-words embedder for offline runs and tests, no network involved."""
+    def __init__(self, dimension: int = 256):
+        self.dimension = dimension
+
+    def _embed(self, text: str):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r"\w+", text.casefold()):
+            digest = hashlib.md5(token.encode()).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return self._embed(text)
+
+#? Retriever backends
+class Retriever:
+    """Searches an index by query embedding, returning (Document, cosine score) pairs best first."""
+    def search(self, vector: list[float], k: int) -> list[tuple[Document, float]]:
+        raise NotImplementedError
+
+    async def asearch(self, vector: list[float], k: int) -> list[tuple[Document, float]]:
+        return self.search(vector, k)
+
+    def close(self):
+        pass
+
+class PineconeRetriever(Retriever):
+    def __init__(self, api_key: str, index_name: str, embeddings: Embeddings, pool_threads: int, max_workers: int):
+        from langchain_pinecone import PineconeVectorStore
+        from pinecone import Pinecone
+
+        pc = Pinecone(api_key=api_key, pool_threads=pool_threads)
+        self._index = pc.Index(index_name)
+        self._vector_store = PineconeVectorStore(index=self._index, embedding=embeddings)
+        # Pinecone's sync client is the pooled one, so queries run on a small dedicated executor
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag")
+
+    def search(self, vector, k):
+        return self._vector_store.similarity_search_by_vector_with_score(vector, k=k)
+
+    async def asearch(self, vector, k):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(self.search, vector, k))
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+class LocalIndexRetriever(Retriever):
+    """In-process cosine top-k over a memory-mapped `<path>.npy` matrix and its `<path>.json` metadata."""
+    def __init__(self, path: str):
+        self._matrix = np.load(f"{path}.npy", mmap_mode="r")
+        with open(f"{path}.json", "r", encoding="utf-8") as file:
+            self._records = json.load(file)
+        if len(self._records) != self._matrix.shape[0]:
+            raise ValueError(f"Local index at {path} is corrupt: {self._matrix.shape[0]} vectors, {len(self._records)} records")
+
+    def search(self, vector, k):
+        if not self._records:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        scores = self._matrix @ (query / norm if norm else query)  # rows are unit length, so this is cosine
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (Document(id=self._records[i]["id"], page_content=self._records[i]["text"], metadata=self._records[i]["metadata"]), float(scores[i]))
+            for i in top
+        ]
+
+#? Build time helpers
+def chunk_document(text: str, source: str, chunk_tokens: int = 400, overlap: int = 60, encoding: str = "cl100k_base") -> list[dict]:
+    """Split `text` into overlapping token windows, each with a content-hash id so re-ingestion is idempotent."""
+    import tiktoken
+
+    encoder = tiktoken.get_encoding(encoding)
+    tokens = encoder.encode(text)
+    step = max(chunk_tokens - overlap, 1)
+    records = []
+    for start in range(0, max(len(tokens) - overlap, 1), step):
+        chunk = encoder.decode(tokens[start:start + chunk_tokens]).strip()
+        if not chunk:
+            continue
+        digest = hashlib.sha256(f"{source}\0{chunk}".encode()).hexdigest()[:32]
+        records.append({"id": f"{source}#{digest}", "text": chunk, "metadata": {"source": source, "chunk": len(records)}})
+    return records
+
+def build_local_index(path: str, records: list[dict], embeddings: Embeddings):
+    """Embed `records` ({"id", "text", "metadata"}) and save them as a LocalIndexRetriever index at `path`."""
+    vectors = np.asarray(embeddings.embed_documents([record["text"] for record in records]), dtype=np.float32)
+    vectors = vectors.reshape(len(records), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    np.save(f"{path}.npy", vectors)
+    with open(f"{path}.json", "w", encoding="utf-8") as file:
+        json.dump(records, file, ensure_ascii=False)
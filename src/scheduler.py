@@ -0,0 +1,137 @@
+from collections import deque
+from typing import Awaitable, Callable
+
+from instrumentation import log_event
+
+import asyncio, logging, time
+
+#? Provider bookkeeping
+class ProviderStats:
+    """Rolling latency and error window for one provider."""
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)  # True for success, False for error
+        self.wins = 0
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+
+    def record_censored(self, latency: float):
+        """A call cancelled after `latency` seconds (it lost a hedge, or the run timed out): its real latency was at
+        least this. Kept as a latency sample so the slow tail that triggered the hedge stays in the percentile;
+        not an outcome, since it neither succeeded nor failed."""
+        self.latencies.append(latency)
+
+    def percentile(self, q: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    @property
+    def error_rate(self):
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+class HedgedScheduler:
+    """Calls the preferred provider and, once it runs past its own observed latency percentile, hedges with the next one.
+    The first successful answer wins and the other call is cancelled. Providers erroring above `max_error_rate`
+    are demoted to hedge position, where they keep getting sampled and can win their way back."""
+    def __init__(
+        self,
+        providers: dict[str, Callable[..., Awaitable]],
+        hedge_percentile: float = 0.9,
+        default_hedge_delay: float = 9,
+        min_samples: int = 10,
+        max_error_rate: float = 0.5,
+        timeout: float = 30,
+        window: int = 100,
+    ):
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.default_hedge_delay = default_hedge_delay
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.timeout = timeout
+        self.stats = {name: ProviderStats(window) for name in providers}
+
+    def _is_failing(self, name: str):
+        stats = self.stats[name]
+        return len(stats.outcomes) >= self.min_samples and stats.error_rate > self.max_error_rate
+
+    def ranked(self) -> list[str]:
+        """Providers in preference order, failing ones moved to the back (stable otherwise)."""
+        return sorted(self.providers, key=self._is_failing)
+
+    def hedge_delay(self, name: str) -> float:
+        stats = self.stats[name]
+        if len(stats.latencies) < self.min_samples:
+            return self.default_hedge_delay
+        return stats.percentile(self.hedge_percentile)
+
+    async def _timed(self, name: str, *args, **kwargs):
+        start = time.monotonic()
+        try:
+            result = await self.providers[name](*args, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats[name].record(time.monotonic() - start, ok=False)
+            raise
+        self.stats[name].record(time.monotonic() - start, ok=True)
+        return result
+
+    async def run(self, *args, **kwargs):
+        """Return (result, provider name). Raises asyncio.TimeoutError, or the last provider error if all fail."""
+        order = self.ranked()
+        deadline = time.monotonic() + self.timeout
+        tasks, started = {}, {}
+
+        def launch(name: str):
+            task = asyncio.create_task(self._timed(name, *args, **kwargs))
+            tasks[task], started[task] = name, time.monotonic()
+
+        launch(order[0])
+        waiting = order[1:]
+        last_error = None
+        settled = False  # a winner or a timeout, as opposed to the caller cancelling the run
+        try:
+            while tasks:
+                wait_for = deadline - time.monotonic()
+                if waiting:
+                    wait_for = min(wait_for, self.hedge_delay(order[0]))
+                if wait_for <= 0:
+                    settled = True
+                    raise asyncio.TimeoutError(f"No provider answered within {self.timeout}s")
+                done, _ = await asyncio.wait(tasks, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = tasks.pop(task)
+                    if task.exception() is None:
+                        self.stats[name].wins += 1
+                        settled = True
+                        return task.result(), name
+                    last_error = task.exception()
+                    log_event("provider_error", logging.WARNING, provider=name, error=str(last_error))
+                # Hedge when the primary is slow, or immediately when everything in flight has failed
+                if waiting and (not done or not tasks):
+                    launch(waiting.pop(0))
+            raise last_error
+        finally:
+            now = time.monotonic()
+            for task, name in tasks.items():
+                task.cancel()
+                if settled:
+                    self.stats[name].record_censored(now - started[task])
+
+    def snapshot(self):
+        return {
+            name: {
+                "p50": stats.percentile(0.5),
+                "p90": stats.percentile(0.9),
+                "error_rate": stats.error_rate,
+                "wins": stats.wins,
+                "demoted": self._is_failing(name),
+            }
+            for name, stats in self.stats.items()
+        }
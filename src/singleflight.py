@@ -0,0 +1,37 @@
+import asyncio
+
+#? Request coalescing
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight task instead of each hitting the backend.
+    Waiters are shielded, so one caller cancelling does not cancel the call for everyone else."""
+    registry = {}  # name -> SingleFlight, for metrics
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight = {}
+        self.calls = 0
+        self.collapsed = 0
+        SingleFlight.registry[name] = self
+
+    async def do(self, key, fn, *args, **kwargs):
+        self.calls += 1
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args, **kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        else:
+            self.collapsed += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    def stats(self):
+        return {"calls": self.calls, "collapsed": self.collapsed, "in_flight": len(self._inflight)}
+
+def singleflight_stats():
+    return {name: flight.stats() for name, flight in SingleFlight.registry.items()}
@@ -0,0 +1,60 @@
+from helper import pool
+from instrumentation import log_event
+
+import asyncio, logging
+
+#? Checkpoint cleanup
+# One round trip: data-modifying CTEs delete from all three checkpoint tables atomically
+WIPE_THREADS_QUERY = """
+WITH writes AS (DELETE FROM checkpoint_writes WHERE thread_id = ANY(%(ids)s)),
+     blobs AS (DELETE FROM checkpoint_blobs WHERE thread_id = ANY(%(ids)s))
+DELETE FROM checkpoints WHERE thread_id = ANY(%(ids)s)
+"""
+
+IDLE_THREADS_QUERY = """
+SELECT thread_id FROM checkpoints
+GROUP BY thread_id
+HAVING max((checkpoint->>'ts')::timestamptz) < now() - make_interval(secs => %(ttl)s)
+LIMIT %(limit)s
+"""
+
+SWEEPER_LOCK_ID = 727001  # advisory lock so only one process sweeps at a time
+
+async def clear_threads(thread_ids: list[str]):
+    """Deletes all records related to the given thread_ids in a single statement."""
+    thread_ids = list(dict.fromkeys(thread_ids))
+    if not thread_ids:
+        return
+    async with pool.connection() as conn:
+        await conn.execute(WIPE_THREADS_QUERY, {"ids": thread_ids})
+
+async def sweep_idle_threads(ttl: float, batch_size: int) -> int:
+    """Wipe threads whose latest checkpoint is older than `ttl` seconds, `batch_size` threads per statement."""
+    swept = 0
+    async with pool.connection() as conn:
+        locked = await (await conn.execute("SELECT pg_try_advisory_lock(%s)", (SWEEPER_LOCK_ID,))).fetchone()
+        if not locked[0]:
+            return 0
+        try:
+            # Autocommit connection, so each batch commits on its own and locks stay short
+            while True:
+                rows = await (await conn.execute(IDLE_THREADS_QUERY, {"ttl": ttl, "limit": batch_size})).fetchall()
+                if rows:
+                    await conn.execute(WIPE_THREADS_QUERY, {"ids": [row[0] for row in rows]})
+                    swept += len(rows)
+                if len(rows) < batch_size:
+                    break
+        finally:
+            await conn.execute("SELECT pg_advisory_unlock(%s)", (SWEEPER_LOCK_ID,))
+    return swept
+
+async def run_sweeper(interval: float, ttl: float, batch_size: int):
+    """Background task started in lifespan: expire idle threads off the request path."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            swept = await sweep_idle_threads(ttl, batch_size)
+            if swept:
+                log_event("threads_swept", swept=swept)
+        except Exception as e:
+            log_event("sweeper_error", logging.WARNING, error=str(e))